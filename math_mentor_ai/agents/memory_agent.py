@@ -1,69 +1,227 @@
-import json
 import os
 import difflib
+import threading
+from array import array
 from datetime import datetime
 
+import numpy as np
+
+from agents.memory_store import MEMORY_DB, MemoryStore, canonical_problem
+
+# The old append-only format; copied into MEMORY_DB when that is still empty
 MEMORY_FILE = "data/memory.jsonl"
 
+# Characters counted one by one for the ratio upper bound; all others share a last bucket
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz+-*/^=()., "
+CHAR_COLUMNS = {char: i for i, char in enumerate(ALPHABET)}
+
+
+class SimilarityIndex:
+    """
+    In-memory character n-gram index over past problems.
+    The problems sharing the most n-grams with the query are re-scored with
+    difflib first. Every other problem whose character counts could still
+    reach the best ratio so far (and the threshold) is re-scored after
+    them, so the result is the one a full difflib scan finds.
+    """
+
+    def __init__(self, ngram_size=3, max_candidates=32):
+        self.ngram_size = ngram_size
+        self.max_candidates = max_candidates
+        self.texts = []          # lowercased problem texts, one per canonical problem, in store order
+        self.entries = []        # latest entry for each problem, so the newest feedback is returned
+        self.positions = {}      # canonical_problem(text) -> position in self.texts
+        self.gram_sizes = array("i")
+        self.lengths = array("i")
+        self.histograms = np.zeros((1024, len(ALPHABET) + 1), dtype=np.uint16)   # character counts per text
+        self.postings = {}       # n-gram -> array of positions
+        self.lock = threading.Lock()
+
+    def ngrams(self, text):
+        # Pad so that very short problems ("x=1") still produce n-grams
+        padded = f" {text} "
+        n = self.ngram_size
+        if len(padded) <= n:
+            return {padded}
+        return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+    def histogram(self, text):
+        columns = [CHAR_COLUMNS.get(char, len(ALPHABET)) for char in text]
+        counts = np.bincount(columns, minlength=len(ALPHABET) + 1) if columns else np.zeros(len(ALPHABET) + 1)
+        return np.minimum(counts, np.iinfo(np.uint16).max)
+
+    def add(self, entry: dict):
+        """Indexes an entry; returns False if it was already there unchanged."""
+        text = (entry.get("problem_text") or "").lower()
+        key = canonical_problem(text)
+        with self.lock:
+            position = self.positions.get(key)
+            if position is not None:
+                # A repeat, however it is spaced or cased, only replaces the entry returned for it
+                if self.entries[position] == entry:
+                    return False
+                self.entries[position] = entry
+                return True
+
+            position = len(self.texts)
+            grams = self.ngrams(text)
+
+            self.texts.append(text)
+            self.entries.append(entry)
+            self.positions[key] = position
+            self.gram_sizes.append(len(grams))
+            self.lengths.append(len(text))
+            if position == len(self.histograms):
+                self.histograms = np.concatenate([self.histograms, np.zeros_like(self.histograms)])
+            self.histograms[position] = self.histogram(text)
+
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array("i")
+                posting.append(position)
+            return True
+
+    def best_match(self, query: str, threshold=0.0):
+        """
+        Returns (entry, ratio) for the best past problem, or (None, 0.0) when
+        none reaches threshold. Ties go to the earliest entry, like a
+        sequential scan.
+        """
+        query = query.lower()
+
+        with self.lock:
+            if not self.texts:
+                return None, 0.0
+
+            n = len(self.texts)
+            # Upper bound on every ratio(): matching characters cannot exceed
+            # the shared character counts (quick_ratio, with rare characters bucketed)
+            common = np.minimum(self.histograms[:n], self.histogram(query)).sum(axis=1)
+            lengths = np.frombuffer(self.lengths, dtype=np.intc)
+            with np.errstate(invalid="ignore"):
+                bounds = np.nan_to_num(2.0 * common / (len(query) + lengths), nan=1.0)
+
+            # Dice coefficient on n-gram sets picks the likely best matches to score first
+            query_grams = self.ngrams(query)
+            hits = [
+                np.frombuffer(self.postings[gram], dtype=np.intc)
+                for gram in query_grams if gram in self.postings
+            ]
+            candidates = []
+            if hits:
+                shared = np.bincount(np.concatenate(hits), minlength=n)
+                sizes = np.frombuffer(self.gram_sizes, dtype=np.intc)
+                dice = 2.0 * shared / (len(query_grams) + sizes)
+                del hits, sizes
+
+                k = min(self.max_candidates, int(np.count_nonzero(shared)))
+                candidates = np.argpartition(-dice, k - 1)[:k]
+                candidates = sorted(candidates.tolist(), key=lambda p: (-dice[p], p))
+
+            # A repeat (up to case and spacing) is scored first, but its spelling
+            # may still differ more from the query than another problem's does
+            repeat = self.positions.get(canonical_problem(query))
+            if repeat is not None:
+                candidates = [repeat] + [p for p in candidates if p != repeat]
+
+            best_position = None
+            highest_ratio = 0.0
+            # Same argument order as a scan: ratio() is not symmetric
+            matcher = difflib.SequenceMatcher(None, query, "")
+
+            def score(candidate):
+                nonlocal best_position, highest_ratio
+                # real_quick_ratio / quick_ratio are cheap upper bounds on ratio
+                floor = max(highest_ratio, threshold)
+                matcher.set_seq2(self.texts[candidate])
+                if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                    return
+
+                ratio = matcher.ratio()
+                if ratio > highest_ratio or (ratio == highest_ratio and best_position is not None and candidate < best_position):
+                    highest_ratio = ratio
+                    best_position = candidate
+
+            for candidate in candidates:
+                score(candidate)
+
+            # Then everything else that could still win, most promising first
+            rest = np.flatnonzero(bounds >= max(highest_ratio, threshold))
+            scored = set(candidates)
+            for candidate in rest[np.lexsort((rest, -bounds[rest]))].tolist():
+                if bounds[candidate] < max(highest_ratio, threshold):
+                    break
+                if candidate not in scored:
+                    score(candidate)
+
+            if best_position is None:
+                return None, 0.0
+            return self.entries[best_position], highest_ratio
+
 class MemoryManager:
-    def __init__(self, filepath=MEMORY_FILE):
+    """
+    Past problems and their feedback, stored in a MemoryStore shared by
+    every process, with an in-process SimilarityIndex over them. The index
+    picks up entries other processes wrote before each lookup.
+    """
+
+    def __init__(self, filepath=MEMORY_DB, legacy_file=MEMORY_FILE):
         self.filepath = filepath
-        self.ensure_memory_file()
-
-    def ensure_memory_file(self):
-        """Creates the memory file if it doesn't exist."""
-        if not os.path.isabs(self.filepath):
-             # Make it relative to this file? No, relative to CWD (project root) is fine.
-             pass
-        
-        directory = os.path.dirname(self.filepath)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
-            
-        if not os.path.exists(self.filepath):
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                pass
+        self.store = MemoryStore(filepath)
+        if legacy_file and os.path.exists(legacy_file):
+            self.store.seed_from_jsonl(legacy_file)
+
+        self.index = SimilarityIndex()
+        self.last_id = 0       # newest store row already in the index
+        self.changes = 0
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Indexes entries committed since the last refresh, by this or any other process."""
+        with self.lock:
+            for row_id, entry in self.store.since(self.last_id):
+                if self.index.add(entry):
+                    self.changes += 1
+                self.last_id = row_id
+
+    @property
+    def revision(self):
+        """Changes whenever memory gains an entry, so cached lookups know when to refresh."""
+        self.refresh()
+        return self.changes
 
     def add_entry(self, entry: dict):
         """
         Saves an interaction.
-        Expected keys: "problem_text", "solution", "steps", "feedback" (optional)
+        Expected keys: "problem_text", "solution", "steps", "feedback" (optional), "topic" (optional)
         """
         entry["timestamp"] = datetime.now().isoformat()
-        with open(self.filepath, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry) + "\n")
+        # Committed with the store's next batch; searchable here at once
+        self.store.append(entry)
+        with self.lock:
+            if self.index.add(entry):
+                self.changes += 1
+
+    def history(self, topic=None, feedback=None, start=None, end=None, limit=50):
+        """Newest entries first, by topic, feedback and ISO timestamp range (indexed lookups)."""
+        self.store.flush()
+        return self.store.query(topic, feedback, start, end, limit)
 
     def find_similar(self, current_problem: str, threshold=0.8):
         """
         Finds a similar solved problem from history.
         """
-        if not os.path.exists(self.filepath):
-            return None
-
-        best_match = None
-        highest_ratio = 0.0
-
         try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line)
-                        past_problem = data.get("problem_text", "")
-                        
-                        # Simple similarity (perfect for "reuse solution patterns")
-                        ratio = difflib.SequenceMatcher(None, current_problem.lower(), past_problem.lower()).ratio()
-                        
-                        if ratio > highest_ratio:
-                            highest_ratio = ratio
-                            best_match = data
-                    except json.JSONDecodeError:
-                        continue
+            self.refresh()
+            best_match, highest_ratio = self.index.best_match(current_problem, threshold)
         except Exception:
             return None
 
-        if highest_ratio >= threshold:
+        if best_match is not None and highest_ratio >= threshold:
             return best_match
-        
+
         return None
 
 # Singleton instance
@@ -0,0 +1,180 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Shared by every app / service / batch process on the machine
+MEMORY_DB = os.environ.get("MEMORY_DB", "data/memory.db")
+MEMORY_FLUSH_MS = float(os.environ.get("MEMORY_FLUSH_MS", "200"))     # how long a write may wait to join a batch
+MEMORY_BATCH_SIZE = int(os.environ.get("MEMORY_BATCH_SIZE", "32"))    # writes that trigger a flush at once
+MEMORY_COMPACT_EVERY = int(os.environ.get("MEMORY_COMPACT_EVERY", "500"))   # writes between compactions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    canonical TEXT NOT NULL,
+    topic TEXT,
+    feedback TEXT,
+    timestamp TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_canonical ON memory (canonical, id);
+CREATE INDEX IF NOT EXISTS memory_timestamp ON memory (timestamp);
+CREATE INDEX IF NOT EXISTS memory_topic ON memory (topic, timestamp);
+CREATE INDEX IF NOT EXISTS memory_feedback ON memory (feedback, timestamp);
+"""
+
+
+INSERT = "INSERT INTO memory (canonical, topic, feedback, timestamp, entry) VALUES (?, ?, ?, ?, ?)"
+
+
+def canonical_problem(text):
+    """Dedup key: case and spacing do not make a different problem ("2x + 5 = 11" == "2X+5=11")."""
+    return "".join((text or "").lower().split())
+
+
+def row(entry):
+    return (canonical_problem(entry.get("problem_text")), entry.get("topic"), entry.get("feedback"),
+            entry.get("timestamp") or datetime.now().isoformat(), json.dumps(entry))
+
+
+class MemoryStore:
+    """
+    Memory entries in SQLite (WAL mode), safe to share between processes:
+    readers never block the writer and concurrent writers wait on SQLite's
+    lock instead of interleaving lines. Writes are queued and committed in
+    batches of up to MEMORY_BATCH_SIZE, at most MEMORY_FLUSH_MS after the
+    first one. Every MEMORY_COMPACT_EVERY writes, older rows of the same
+    canonical problem are deleted, so only the latest feedback is kept.
+    """
+
+    def __init__(self, path=MEMORY_DB, flush_ms=MEMORY_FLUSH_MS, batch_size=MEMORY_BATCH_SIZE,
+                 compact_every=MEMORY_COMPACT_EVERY):
+        self.path = path
+        self.flush_s = flush_ms / 1000
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self.pending = []
+        self.timer = None
+        self.writes_since_compact = 0
+        self.local = threading.local()    # readers: one sqlite3 connection per thread
+        self.lock = threading.RLock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Batches are written from whichever thread flushes, always under self.lock
+        self.writer = self.connect(check_same_thread=False)
+        with self.writer:
+            self.writer.executescript(SCHEMA)
+        atexit.register(self.flush)
+
+    def connect(self, **kwargs):
+        conn = sqlite3.connect(self.path, timeout=30, **kwargs)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only risks the last commits on power loss, never corruption
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+        return conn
+
+    # ---- writes ----
+    def append(self, entry):
+        """Queues an entry; it is committed with the next batch."""
+        entry.setdefault("timestamp", datetime.now().isoformat())
+        with self.lock:
+            self.pending.append(entry)
+            if len(self.pending) < self.batch_size:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_s, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Commits the queued entries in one transaction."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            rows, self.pending = self.pending, []
+            if not rows:
+                return
+
+            with self.writer:
+                self.writer.executemany(INSERT, [row(e) for e in rows])
+            self.writes_since_compact += len(rows)
+            if self.compact_every and self.writes_since_compact >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """Keeps only the latest row of each canonical problem. Returns the number removed."""
+        with self.lock, self.writer:
+            removed = self.writer.execute(
+                "DELETE FROM memory WHERE id NOT IN (SELECT MAX(id) FROM memory GROUP BY canonical)"
+            ).rowcount
+            self.writes_since_compact = 0
+        return removed
+
+    def seed_from_jsonl(self, path):
+        """
+        Copies the entries of a JSONL memory file (the old format) into the
+        store if it is still empty. Returns the number copied; one process
+        wins when several start at once.
+        """
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+        with self.lock, self.writer:
+            # Taking the write lock first makes check-and-insert atomic across processes
+            self.writer.execute("BEGIN IMMEDIATE")
+            if self.writer.execute("SELECT 1 FROM memory LIMIT 1").fetchone() is not None:
+                return 0
+            self.writer.executemany(INSERT, [row(e) for e in entries])
+        return len(entries)
+
+    # ---- reads ----
+    def since(self, last_id=0):
+        """[(id, entry), ...] committed after last_id, oldest first."""
+        rows = self.connection().execute(
+            "SELECT id, entry FROM memory WHERE id > ? ORDER BY id", (last_id,)
+        )
+        return [(row_id, json.loads(entry)) for row_id, entry in rows]
+
+    def query(self, topic=None, feedback=None, start=None, end=None, limit=50):
+        """Newest entries first, filtered by topic, feedback and an ISO timestamp range."""
+        clauses, params = [], []
+        for column, value in (("topic", topic), ("feedback", feedback)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connection().execute(
+            f"SELECT entry FROM memory {where} ORDER BY timestamp DESC LIMIT ?", params + [limit]
+        )
+        return [json.loads(entry) for (entry,) in rows]
+
+    def stats(self):
+        rows, problems = self.connection().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT canonical) FROM memory"
+        ).fetchone()
+        return {"rows": rows, "problems": problems, "pending": len(self.pending)}
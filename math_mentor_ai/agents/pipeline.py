@@ -0,0 +1,213 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import sympy
+
+from agents.parser_agent import parser_agent
+from agents.intent_router import intent_router
+from agents.solver_agent import solver_agent
+from agents.verifier_agent import verifier_agent
+from agents.explainer_agent import explainer_agent
+from agents.solve_cache import SolveCache
+from model_registry import registry
+from tracing import tracer
+
+# Bump when an agent's logic or output changes, so memoized results are not reused
+PIPELINE_VERSION = "1"
+PIPELINE_MEMO_SIZE = int(os.environ.get("PIPELINE_MEMO_SIZE", "256"))
+MEMORY_MEMO_SIZE = int(os.environ.get("PIPELINE_MEMORY_MEMO_SIZE", "64"))
+# Run retrieval, memory lookup and solve side by side (0: one after another)
+CONCURRENT_STAGES = os.environ.get("PIPELINE_CONCURRENT", "1") != "0"
+STAGE_THREADS = int(os.environ.get("PIPELINE_STAGE_THREADS", "8"))
+
+
+def component_versions():
+    """Everything besides the problem text that a memoized pipeline result depends on."""
+    from rag.retriever import RETRIEVAL_MODE, TOPIC_SHARDS, index_version
+    rag = f"{RETRIEVAL_MODE}:{int(TOPIC_SHARDS)}:{index_version()}" if registry.is_enabled("rag") else "off"
+    return f"pipeline={PIPELINE_VERSION};sympy={sympy.__version__};rag={rag}"
+
+
+def memo_key(problem_text, *parts):
+    """Memo key for a normalized problem text (whitespace collapsed) and the given parts."""
+    return "|".join([str(p) for p in parts] + [" ".join((problem_text or "").split())])
+
+
+def memoizable(solver_output, verifier_output=None):
+    """Timeouts depend on load, not on the problem, so they are never memoized."""
+    return not solver_output.get("timed_out") and not (verifier_output or {}).get("timed_out")
+
+
+# Full stage results per problem, shared by every session of a server process.
+# Entries are read-only mappings; each run copies the one it reuses.
+pipeline_memo = SolveCache(maxsize=PIPELINE_MEMO_SIZE)
+# Memory lookups, keyed on the memory revision: every feedback click adds a
+# revision, so they get their own small cache instead of evicting pipeline results
+memory_memo = SolveCache(maxsize=MEMORY_MEMO_SIZE)
+
+
+# ---------------- STAGE POOL ----------------
+_stage_pool = None
+_stage_pool_lock = threading.Lock()
+
+
+def stage_pool():
+    """
+    Process-wide threads for stages that wait rather than compute in Python:
+    embedding / FAISS search release the GIL, and a SymPy solve sent to the
+    worker processes only blocks on a pipe.
+    """
+    global _stage_pool
+    with _stage_pool_lock:
+        if _stage_pool is None:
+            _stage_pool = ThreadPoolExecutor(STAGE_THREADS, thread_name_prefix="pipeline-stage")
+        return _stage_pool
+
+
+def submit_stage(stage, fn, *args, span_attributes=None, **kwargs):
+    """
+    Runs fn on the stage pool inside a tracing span named stage. The caller's
+    context is copied into the thread, so the span nests under the current one.
+    span_attributes(result), if given, returns attributes to set on the span.
+    """
+    def call():
+        with tracer.span(stage) as span:
+            result = fn(*args, **kwargs)
+            for key, value in (span_attributes(result) if span_attributes else {}).items():
+                span.set_attribute(key, value)
+            return result
+    return stage_pool().submit(contextvars.copy_context().run, call)
+
+
+@tracer.traced("pipeline")
+def run_pipeline(raw_text, solve=solver_agent, verify=verifier_agent, retrieve=None, find_similar=None,
+                 concurrent=CONCURRENT_STAGES):
+    """
+    Runs parser -> intent_router -> (RAG, memory) -> solver -> verifier -> explainer
+    on one problem without any UI. solve / verify can be swapped for the
+    deadline-bounded worker pool versions; retrieve / find_similar are optional
+    (retrieve is called as retrieve(problem_text, topic=topic)).
+    Returns a flat, JSON-serializable result with per-stage timings (ms).
+    Each stage is also a tracing span under one "pipeline" trace.
+
+    With concurrent set, RAG and memory lookup run on the stage pool while
+    the solver runs, and the explainer runs there while the verifier checks
+    the answer. Solver and verifier always run on the calling thread, so a
+    deadline-bounded solve / verify never spends its budget queued for a
+    stage thread. The solver is then given no retrieved chunks (it does not use
+    them). saved_ms is the sum of stage timings minus the end-to-end time,
+    i.e. what running stages side by side took off the critical path.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    def timed(stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            with tracer.span(stage):
+                return fn(*args, **kwargs)
+        finally:
+            timings[stage] = round((time.perf_counter() - t0) * 1000, 3)
+
+    def start_stage(stage, fn, *args, **kwargs):
+        """A future for the stage: on the stage pool, or already run inline when not concurrent."""
+        if concurrent:
+            return stage_pool().submit(contextvars.copy_context().run, timed, stage, fn, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(timed(stage, fn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def finish():
+        timings["total"] = round((time.perf_counter() - start) * 1000, 3)
+        stage_sum = sum(ms for stage, ms in timings.items() if stage != "total")
+        result["saved_ms"] = round(max(0.0, stage_sum - timings["total"]), 3)
+        return result
+
+    result = {
+        "problem_text": None,
+        "topic": None,
+        "intent": None,
+        "solution": None,
+        "steps": [],
+        "verified": False,
+        "verification_reason": None,
+        "explanation": None,
+        "retrieved_chunks": [],
+        "memory_match": None,
+        "error": None,
+        "timings": timings,
+        "saved_ms": 0.0
+    }
+
+    parsed_output = timed("parser", parser_agent, raw_text)
+    result["problem_text"] = parsed_output["problem_text"]
+    result["topic"] = parsed_output["topic"]
+
+    if parsed_output["needs_clarification"]:
+        result["error"] = parsed_output["clarification_question"]
+        return finish()
+
+    intent = timed("intent_router", intent_router, parsed_output)
+    result["intent"] = intent
+
+    # RAG, memory and solver depend only on the parsed problem
+    rag_future = memory_future = None
+    if retrieve is not None and intent != "chitchat":
+        rag_future = start_stage("retrieve", retrieve, parsed_output["problem_text"], topic=parsed_output["topic"])
+    if intent == "solve_math" and find_similar is not None:
+        memory_future = start_stage("memory", find_similar, parsed_output["problem_text"])
+
+    def collect_rag():
+        if rag_future is None:
+            return
+        try:
+            result["retrieved_chunks"] = rag_future.result()
+        except Exception as e:
+            # A solver error takes precedence
+            result["error"] = result["error"] or f"RAG Retrieval failed: {e}"
+
+    if intent == "solve_math":
+        # Parsed into SymPy where it is solved (a worker process when solve is the
+        # pool version); the verifier reuses that parse
+        problem = parsed_output["problem_text"]
+        if not concurrent:
+            collect_rag()
+        solver_output = timed("solver", solve, problem, result["retrieved_chunks"])
+        result["solution"] = solver_output["solution"]
+        result["steps"] = solver_output["steps"]
+
+        if solver_output["error"]:
+            result["error"] = solver_output["error"]
+        else:
+            # Verification and explanation both only need the solution
+            explainer_future = start_stage(
+                "explainer", explainer_agent,
+                parsed_output["problem_text"], solver_output["steps"], solver_output["solution"]
+            )
+            verifier_output = timed(
+                "verifier", verify,
+                problem, solver_output["solution"], solver_output["values"], solver_output["target"]
+            )
+            result["explanation"] = explainer_future.result()
+            result["verified"] = verifier_output["verified"]
+            result["verification_reason"] = verifier_output["reason"]
+
+        # Only now wait for the side stages, so they never hold up the solution
+        if memory_future is not None:
+            similar_entry = memory_future.result()
+            if similar_entry:
+                result["memory_match"] = similar_entry.get("problem_text")
+        collect_rag()
+
+    else:
+        collect_rag()
+        if intent == "chitchat":
+            result["error"] = "Input ambiguous or off-topic."
+
+    return finish()
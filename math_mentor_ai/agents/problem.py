@@ -0,0 +1,73 @@
+import functools
+import re
+from dataclasses import dataclass, field
+
+from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
+
+from agents.parser_agent import normalize_math_text
+from agents.solve_cache import canonical_key
+
+transformations = (standard_transformations + (implicit_multiplication_application,))
+
+# Instruction words stripped before the text is handed to SymPy
+INSTRUCTION_WORDS = re.compile(r"\b(solve|find|calculate|determine|value|of|for|simplify)\b", re.IGNORECASE)
+
+
+@dataclass
+class ParsedProblem:
+    """
+    A problem parsed into SymPy once and shared by the solver and verifier,
+    so neither re-normalizes or re-parses the text. parse_expr evaluates
+    its input, so this is only built where SymPy runs: inside the
+    deadline-bounded worker processes (or in-process when there are none).
+    """
+    text: str                        # normalized problem text
+    math_text: str = ""              # instruction words stripped, as given to parse_expr
+    lhs: object = None               # equations only
+    rhs: object = None               # equations only
+    expr: object = None              # the expression (lhs - rhs for equations)
+    symbols: list = field(default_factory=list)  # free symbols in canonical (name) order
+    cache_key: str = None            # canonical form, see agents.solve_cache
+    error: str = None                # parse failure, if any
+
+    @property
+    def is_equation(self):
+        return self.lhs is not None
+
+
+def build_problem(clean_text: str) -> ParsedProblem:
+    """
+    Parses normalized text into a ParsedProblem. Parse failures are recorded
+    on the object rather than raised.
+    """
+    math_text = INSTRUCTION_WORDS.sub("", clean_text).replace("?", "").strip()
+    problem = ParsedProblem(text=clean_text, math_text=math_text)
+
+    try:
+        if "=" in math_text:
+            # Split Equation Before Simplifying
+            lhs_str, rhs_str = math_text.split("=", 1)
+            problem.lhs = parse_expr(lhs_str, transformations=transformations)
+            problem.rhs = parse_expr(rhs_str, transformations=transformations)
+            problem.expr = problem.lhs - problem.rhs
+            problem.cache_key, problem.symbols = canonical_key(problem.lhs, problem.rhs)
+        else:
+            problem.expr = parse_expr(math_text, transformations=transformations)
+            problem.cache_key, problem.symbols = canonical_key(problem.expr)
+    except Exception as e:
+        problem.error = str(e)
+
+    return problem
+
+
+@functools.lru_cache(maxsize=256)
+def parse_problem(text: str) -> ParsedProblem:
+    # The verifier usually follows the solver on the same text; it reuses this parse
+    return build_problem(normalize_math_text(text))
+
+
+def ensure_problem(problem) -> ParsedProblem:
+    """Accepts a ParsedProblem or problem text (parsed here, once per text)."""
+    if isinstance(problem, ParsedProblem):
+        return problem
+    return parse_problem(problem or "")
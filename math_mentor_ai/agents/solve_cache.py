@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import sympy
+
+SOLVE_CACHE_FILE = os.environ.get("SOLVE_CACHE_FILE", "data/solve_cache.db")
+
+
+def canonical_symbols(expr):
+    """
+    Free symbols in a fixed (name) order, plus the renaming to _v0, _v1, ...
+    so "2x+5=11" and "2y+5=11" share a cache key.
+    """
+    symbols = sorted(expr.free_symbols, key=lambda s: s.name)
+    mapping = {s: sympy.Symbol(f"_v{i}") for i, s in enumerate(symbols)}
+    return symbols, mapping
+
+
+def canonical_key(lhs, rhs=None):
+    """
+    Cache key for a parsed problem: an equation is normalized to lhs - rhs
+    or rhs - lhs, whichever serializes first, so swapping the sides keeps
+    the key; an expression is used as is. Returns (key, symbols).
+    """
+    if rhs is None:
+        symbols, mapping = canonical_symbols(lhs)
+        return f"expr:{sympy.srepr(lhs.xreplace(mapping))}", symbols
+
+    expr = lhs - rhs
+    symbols, mapping = canonical_symbols(expr)
+    form = min(sympy.srepr(expr.xreplace(mapping)), sympy.srepr((-expr).xreplace(mapping)))
+    return f"eq:{form}", symbols
+
+
+def to_canonical(expr, symbols):
+    """Serializes a SymPy result with the problem's symbols renamed."""
+    mapping = {s: sympy.Symbol(f"_v{i}") for i, s in enumerate(symbols)}
+    return sympy.srepr(sympify_value(expr).xreplace(mapping))
+
+
+def from_canonical(text, symbols):
+    """Inverse of to_canonical for the current problem's symbols."""
+    mapping = {sympy.Symbol(f"_v{i}"): s for i, s in enumerate(symbols)}
+    return sympy.sympify(text).xreplace(mapping)
+
+
+def sympify_value(value):
+    return value if isinstance(value, sympy.Basic) else sympy.sympify(value)
+
+
+class SolveCache:
+    """
+    LRU cache of solver results and verifier verdicts keyed on canonical
+    problem forms. With persist_path set, every write also goes to a SQLite
+    table (WAL mode) shared by all processes, the SymPy workers included,
+    and a miss in memory falls through to it. Hot answers then survive
+    restarts and every worker sees the others' results. Writes from
+    several processes are serialized by SQLite, so none are lost.
+    """
+
+    def __init__(self, maxsize=1024, persist_path=None):
+        self.maxsize = maxsize
+        self.persist_path = persist_path
+        self.max_rows = 4 * maxsize      # kept on disk; the oldest writes go first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.local = threading.local()    # one sqlite3 connection per thread
+        self.lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.persist_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS solve_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS solve_cache_stored ON solve_cache (stored)")
+            self.local.conn = conn
+        return conn
+
+    def remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self.load(key) if self.persist_path else None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.remember(key, value)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.remember(key, value)
+        if self.persist_path:
+            self.store(key, value)
+
+    def load(self, key):
+        try:
+            row = self.connection().execute("SELECT value FROM solve_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None    # the disk tier is only an optimization
+        return json.loads(row[0]) if row else None
+
+    def store(self, key, value):
+        try:
+            conn = self.connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO solve_cache VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            self.writes += 1
+            if self.writes % 256 == 0:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM solve_cache WHERE key IN "
+                        "(SELECT key FROM solve_cache ORDER BY stored DESC LIMIT -1 OFFSET ?)", (self.max_rows,)
+                    )
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def clear(self):
+        """Empties the in-memory tier and the counters (the disk tier is kept)."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+# Singleton instance
+solve_cache = SolveCache(persist_path=SOLVE_CACHE_FILE or None)
@@ -1,21 +1,9 @@
 import sympy
 from sympy import symbols, solve, sympify, Eq, simplify
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
-import re
 
-transformations = (standard_transformations + (implicit_multiplication_application,))
-
-def normalize_math_text(text: str) -> str:
-    # Redundant normalization to be safe
-    text = text.lower()
-    replacements = {
-        " plus ": "+", " minus ": "-", " times ": "*", " multiplied by ": "*",
-        " divided by ": "/", " over ": "/", " equals to ": "=", " equals ": "=",
-        " equal to ": "=", " is equal to ": "=", "=": "="
-    }
-    for word, symbol in replacements.items():
-        text = text.replace(word, symbol)
-    return text.strip()
+from agents.problem import ensure_problem
+from agents.solve_cache import solve_cache, to_canonical, from_canonical
+from tracing import tracer
 
 def solve_linear_steps(lhs, rhs, variable):
     """
@@ -46,31 +34,32 @@ def solve_linear_steps(lhs, rhs, variable):
         pass
     return []
 
-def solver_agent(problem_text, retrieved_chunks):
+def solver_agent(problem, retrieved_chunks):
     """
     Solve the math problem using SymPy.
+    `problem` is the problem text or an already built ParsedProblem (agents.problem).
+    Besides the display string, the SymPy solution values are returned so the
+    verifier can check them without parsing the string back.
     """
+    with tracer.span("solver.parse"):
+        problem = ensure_problem(problem)
     steps = []
-    
-    # 1. Cleaning & Normalization
-    cleaned_text = re.sub(r"\b(solve|find|calculate|determine|value|of|for|simplify)\b", "", problem_text, flags=re.IGNORECASE)
-    cleaned_text = normalize_math_text(cleaned_text)
-    cleaned_text = cleaned_text.replace("?", "")
-    
-    # 2. Variable Detection (Regex as requested + SymPy backup)
-    # The parser likely handled this, but we double check for the context of this specific internal solve
-    detected_vars = re.findall(r"[a-zA-Z]", cleaned_text)
 
     try:
+        if problem.error:
+            raise ValueError(problem.error)
+
         solution = None
+        values = []
+        target_var = None
+        canon_symbols = problem.symbols
+
+        # Repeated problems (up to spacing / variable names) skip solve()
+        cached = solve_cache.get(problem.cache_key)
+        hit = cached is not None
         
-        if "=" in cleaned_text:
-            # FIX 3: Split Equation Before Simplifying
-            lhs_str, rhs_str = cleaned_text.split("=", 1)
-            
-            # Parse with implicit multiplication
-            lhs = parse_expr(lhs_str, transformations=transformations)
-            rhs = parse_expr(rhs_str, transformations=transformations)
+        if problem.is_equation:
+            lhs, rhs = problem.lhs, problem.rhs
             
             steps.append(f"Equation: {sympy.latex(lhs)} = {sympy.latex(rhs)}")
             
@@ -79,12 +68,21 @@ def solver_agent(problem_text, retrieved_chunks):
             
             if not atoms:
                 # Arithmetic check
-                if simplify(lhs - rhs) == 0:
-                    return {"solution": "True", "steps": ["LHS equals RHS."], "confidence": 1.0, "error": None}
+                if not hit:
+                    with tracer.span("solver.simplify"):
+                        cached = {"holds": simplify(lhs - rhs) == 0}
+                    solve_cache.put(problem.cache_key, cached)
+
+                if cached["holds"]:
+                    return {"solution": "True", "steps": ["LHS equals RHS."], "confidence": 1.0, "error": None, "cached": hit, "values": [], "target": None}
                 else:
-                    return {"solution": "False", "steps": ["LHS does not equal RHS."], "confidence": 1.0, "error": None}
+                    return {"solution": "False", "steps": ["LHS does not equal RHS."], "confidence": 1.0, "error": None, "cached": hit, "values": [], "target": None}
 
-            target_var = list(atoms)[0] # Default to first found
+            if hit:
+                target_var = canon_symbols[cached["target"]]
+            else:
+                # Symbols of lhs - rhs in name order; one that cancels out (y in x + y = y + 3) is not a target
+                target_var = canon_symbols[0] if canon_symbols else min(atoms, key=lambda s: s.name)
             
             # Generate heuristic steps for linear case
             linear_steps = solve_linear_steps(lhs, rhs, target_var)
@@ -93,39 +91,59 @@ def solver_agent(problem_text, retrieved_chunks):
             else:
                 steps.append(f"Solving for {target_var}...")
 
-            # Solve: lhs - rhs = 0
-            solutions = solve(lhs - rhs, target_var, dict=True)
+            if hit:
+                values = [from_canonical(v, canon_symbols) for v in cached["solutions"]]
+            else:
+                # Solve: lhs - rhs = 0
+                with tracer.span("solver.solve", variable=str(target_var)):
+                    solutions = solve(problem.expr, target_var, dict=True)
+                # s is a dict {x: 3}
+                values = [list(s.values())[0] for s in solutions]
+                if target_var in canon_symbols:
+                    solve_cache.put(problem.cache_key, {
+                        "target": canon_symbols.index(target_var),
+                        "solutions": [to_canonical(v, canon_symbols) for v in values]
+                    })
             
-            if not solutions:
+            if not values:
                 solution = "No solution found"
             else:
                 # Format output
-                sol_list = []
-                for s in solutions:
-                    # s is a dict {x: 3}
-                    val = list(s.values())[0]
-                    sol_list.append(str(val))
+                sol_list = [str(val) for val in values]
                 
                 solution = ", ".join(sol_list)
                 steps.append(f"Final Answer: {target_var} = {solution}")
 
         else:
             # Expression evaluation
-            expr = parse_expr(cleaned_text, transformations=transformations)
+            expr = problem.expr
             steps.append(f"Expression: {sympy.latex(expr)}")
             
             if not expr.free_symbols:
-                solution = str(expr.evalf())
+                if not hit:
+                    with tracer.span("solver.evaluate"):
+                        cached = {"value": to_canonical(expr.evalf(), canon_symbols)}
+                    solve_cache.put(problem.cache_key, cached)
+                values = [from_canonical(cached["value"], canon_symbols)]
                 steps.append(f"Use arithmetic to evaluate.")
             else:
-                solution = str(sympy.simplify(expr))
+                if not hit:
+                    with tracer.span("solver.simplify"):
+                        cached = {"simplified": to_canonical(sympy.simplify(expr), canon_symbols)}
+                    solve_cache.put(problem.cache_key, cached)
+                values = [from_canonical(cached["simplified"], canon_symbols)]
                 steps.append(f"Simplify terms.")
+
+            solution = str(values[0])
             
         return {
             "solution": solution,
             "steps": steps,
             "confidence": 1.0,
-            "error": None
+            "error": None,
+            "cached": hit,
+            "values": values,
+            "target": target_var
         }
 
     except Exception as e:
@@ -133,5 +151,8 @@ def solver_agent(problem_text, retrieved_chunks):
             "solution": None,
             "steps": [],
             "confidence": 0.0,
-            "error": f"Math error: {str(e)}"
+            "error": f"Math error: {str(e)}",
+            "cached": False,
+            "values": [],
+            "target": None
         }
@@ -1,12 +1,118 @@
+from collections import Counter
+
+import numpy as np
 import sympy
 from sympy import sympify
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
+from sympy.parsing.sympy_parser import parse_expr
+
+from agents.problem import ensure_problem, transformations
+from agents.solve_cache import from_canonical, solve_cache, to_canonical
+
+# Numeric tier: |residual| below ACCEPT_TOL * scale accepts, above REJECT_TOL * scale
+# rejects, anything in between (or nan/inf) falls through to sympy.simplify.
+ACCEPT_TOL = 1e-9
+REJECT_TOL = 1e-6
+SAMPLE_POINTS = 6
+
+# How often each tier decided a verdict, to measure the simplify() calls avoided
+tier_counts = Counter()
+
+
+def numeric_verdict(residual, *sides):
+    """
+    Classifies evaluated residual values: True (zero), False (non-zero) or
+    None (inconclusive).
+    """
+    residual = np.atleast_1d(np.asarray(residual, dtype=complex))
+    scale = 1.0
+    for side in sides:
+        side = np.atleast_1d(np.asarray(side, dtype=complex))
+        if not np.all(np.isfinite(side)):
+            return None
+        scale = max(scale, float(np.max(np.abs(side))))
+
+    if not np.all(np.isfinite(residual)):
+        return None
+
+    error = float(np.max(np.abs(residual)))
+    if error <= ACCEPT_TOL * scale:
+        return True
+    if error > REJECT_TOL * scale:
+        return False
+    return None
+
+
+def numeric_check_solution(lhs, rhs, var, sol_val):
+    """Evaluates lhs and rhs at var = sol_val with NumPy."""
+    if sol_val.free_symbols or (lhs - rhs).free_symbols - {var}:
+        return None
+    try:
+        point = complex(sol_val)
+        f_lhs = sympy.lambdify([var], lhs, "numpy")
+        f_rhs = sympy.lambdify([var], rhs, "numpy")
+        with np.errstate(all="ignore"):
+            left, right = f_lhs(point), f_rhs(point)
+        return numeric_verdict(np.subtract(left, right), left, right)
+    except Exception:
+        return None
+
+
+def numeric_check_equivalent(original, proposed):
+    """Compares two expressions at random complex points."""
+    variables = sorted(original.free_symbols | proposed.free_symbols, key=lambda s: s.name)
+    # SymPy symbols are complex, so sample the whole plane: identities that
+    # only hold on a branch (sqrt(x**2) == x) must not pass
+    rng = np.random.default_rng(0)
+    shape = (len(variables), SAMPLE_POINTS)
+    points = rng.uniform(-2.0, 2.0, shape) + 1j * rng.uniform(-2.0, 2.0, shape)
+    try:
+        f_original = sympy.lambdify(variables, original, "numpy")
+        f_proposed = sympy.lambdify(variables, proposed, "numpy")
+        with np.errstate(all="ignore"):
+            left = np.broadcast_to(f_original(*points), (SAMPLE_POINTS,))
+            right = np.broadcast_to(f_proposed(*points), (SAMPLE_POINTS,))
+        return numeric_verdict(left - right, left, right)
+    except Exception:
+        return None
+
+
+def verdict_key(problem_key, proposed, canon_symbols):
+    # "verdict|": entries from before reasons were stored with canonical names are not reused
+    return f"verdict|{problem_key}|{to_canonical(proposed, canon_symbols)}"
+
+
+def present(verdict, symbols):
+    """
+    Cached verdicts use the canonical _v0, _v1, ... names, since they are
+    shared by problems that differ only in variable names. The reason gets
+    this problem's names back.
+    """
+    verdict = dict(verdict)
+    sides = verdict.pop("sides", None)
+    if sides is not None:
+        verdict["reason"] = verdict["reason"].format(*(from_canonical(side, symbols) for side in sides))
+    return verdict
+
+
+def remember(key, verdict, symbols):
+    tier_counts[verdict["tier"]] += 1
+    solve_cache.put(key, verdict)
+    return dict(present(verdict, symbols), cached=False)
+
 
-transformations = (standard_transformations + (implicit_multiplication_application,))
+def recall(key, symbols):
+    verdict = solve_cache.get(key)
+    if verdict is None:
+        return None
+    tier_counts["cache"] += 1
+    return dict(present(verdict, symbols), cached=True)
 
-def verifier_agent(problem_text, solution):
+def verifier_agent(problem, solution, values=None, target=None):
     """
     Verify the solution by substituting back into equation using SymPy.
+    `problem` is the problem text or an already built ParsedProblem (agents.problem).
+    `values` / `target` are the solver's SymPy results; without them the
+    solution string is parsed instead.
     """
 
     try:
@@ -16,65 +122,104 @@ def verifier_agent(problem_text, solution):
                 "reason": "No solution provided to verify"
             }
 
-        import re
-        cleaned_text = re.sub(r"\b(solve|find|calculate|determine|value|of|for|simplify)\b", "", problem_text, flags=re.IGNORECASE).strip()
-        cleaned_text = cleaned_text.replace("?", "")
+        problem = ensure_problem(problem)
+        if problem.error:
+            raise ValueError(problem.error)
 
-        if "=" not in cleaned_text:
+        if not problem.is_equation:
              # Might be an expression that was simplified. 
              # Verification for simplification is harder (need to check if original == simplified).
              # Let's try:
+             original = problem.expr
              try:
-                 original = parse_expr(cleaned_text, transformations=transformations)
-                 proposed = parse_expr(solution, transformations=transformations)
-                 if sympy.simplify(original - proposed) == 0:
-                     return {"verified": True, "reason": "Expression simplification verified"}
+                 proposed = values[0] if values else parse_expr(solution, transformations=transformations)
              except:
-                 pass
+                 return {
+                    "verified": False,
+                    "reason": "Not an equation, verification limited."
+                }
+
+             key = verdict_key(problem.cache_key, proposed, problem.symbols)
+             cached = recall(key, problem.symbols)
+             if cached is not None:
+                 return cached
+
+             # Tier 1: compare at random points, only simplify when inconclusive
+             equivalent = numeric_check_equivalent(original, proposed)
+             tier = "numeric"
+             if equivalent is None:
+                 tier = "symbolic"
+                 try:
+                     equivalent = sympy.simplify(original - proposed) == 0
+                 except:
+                     equivalent = False
+
+             if equivalent:
+                 return remember(key, {"verified": True, "reason": "Expression simplification verified", "tier": tier}, problem.symbols)
              
-             return {
+             return remember(key, {
                 "verified": False,
-                "reason": "Not an equation, verification limited."
-            }
+                "reason": "Not an equation, verification limited.",
+                "tier": tier
+            }, problem.symbols)
 
-        lhs_str, rhs_str = cleaned_text.split("=", 1)
-        lhs = parse_expr(lhs_str, transformations=transformations)
-        rhs = parse_expr(rhs_str, transformations=transformations)
-        
-        # If solution is a string representation of a list/dict (complex case), skip for now
-        if "[" in str(solution) or "{" in str(solution):
-             return {
-                "verified": True, 
-                "reason": "Skipped verification for complex solution set (trusted)"
-            }
-
-        # Assume single variable scalar solution
-        sol_val = parse_expr(solution, transformations=transformations)
-        
+        lhs, rhs = problem.lhs, problem.rhs
         atoms = lhs.free_symbols.union(rhs.free_symbols)
         
         if not atoms:
              if lhs == rhs:
-                 return {"verified": True, "reason": "Arithmetic verified"}
+                 return {"verified": True, "reason": "Arithmetic verified", "tier": "symbolic"}
              else:
-                 return {"verified": False, "reason": "Arithmetic check failed"}
-        
-        # Use the first variable found
-        var = list(atoms)[0]
-        
-        check_lhs = lhs.subs(var, sol_val)
-        check_rhs = rhs.subs(var, sol_val)
-        
-        if sympy.simplify(check_lhs - check_rhs) == 0:
-            return {
-                "verified": True,
-                "reason": "Solution verified successfully by substitution"
-            }
+                 return {"verified": False, "reason": "Arithmetic check failed", "tier": "symbolic"}
 
-        return {
-            "verified": False,
-            "reason": f"Substitution failed: {check_lhs} != {check_rhs}"
-        }
+        if values is None:
+            # If solution is a string representation of a list/dict (complex case), skip for now
+            if "[" in str(solution) or "{" in str(solution):
+                 return {
+                    "verified": True, 
+                    "reason": "Skipped verification for complex solution set (trusted)"
+                }
+
+            # Assume single variable scalar solution
+            values = [parse_expr(solution, transformations=transformations)]
+
+        if not values:
+            return {"verified": False, "reason": "No solution provided to verify"}
+
+        # Use the solver's variable, else the first variable found
+        var = target if target is not None else min(atoms, key=lambda s: s.name)
+
+        # A problem already verified with this answer skips substitution
+        key = verdict_key(problem.cache_key, sympy.Tuple(var, *values), problem.symbols)
+        cached = recall(key, problem.symbols)
+        if cached is not None:
+            return cached
+
+        tier = "numeric"
+        for sol_val in values:
+            check_lhs = lhs.subs(var, sol_val)
+            check_rhs = rhs.subs(var, sol_val)
+
+            # Tier 1: evaluate the residual numerically, only simplify when inconclusive
+            holds = numeric_check_solution(lhs, rhs, var, sol_val)
+            if holds is None:
+                tier = "symbolic"
+                holds = sympy.simplify(check_lhs - check_rhs) == 0
+
+            if not holds:
+                # The sides are stored canonically and named per problem (see present)
+                return remember(key, {
+                    "verified": False,
+                    "reason": "Substitution failed: {} != {}",
+                    "sides": [to_canonical(check_lhs, problem.symbols), to_canonical(check_rhs, problem.symbols)],
+                    "tier": tier
+                }, problem.symbols)
+
+        return remember(key, {
+            "verified": True,
+            "reason": "Solution verified successfully by substitution",
+            "tier": tier
+        }, problem.symbols)
 
     except Exception as e:
         return {
@@ -0,0 +1,192 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from tracing import tracer
+
+# Per-problem time budget (seconds) for solver/verifier calls
+SOLVE_TIMEOUT = float(os.environ.get("SOLVE_TIMEOUT", "10"))
+
+
+def worker_main(conn):
+    """
+    Worker loop. SymPy and the agents are imported once, before the first
+    task arrives, so dispatch only pays for the math itself.
+    """
+    from agents.solve_cache import solve_cache
+    from agents.solver_agent import solver_agent
+    from agents.verifier_agent import tier_counts, verifier_agent
+
+    def counters():
+        return Counter(cache_hits=solve_cache.hits, cache_misses=solve_cache.misses,
+                       **{f"tier_{tier}": n for tier, n in tier_counts.items()})
+
+    tasks = {
+        "solve": solver_agent,
+        "verify": verifier_agent,
+    }
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+
+        # Spans from inside the agent go back with the result, under the caller's span
+        name, args, trace_context = message
+        before = counters()
+        with tracer.remote(trace_context) as spans:
+            try:
+                status, payload = "ok", tasks[name](*args)
+            except Exception as e:
+                status, payload = "error", f"{type(e).__name__}: {e}"
+        # Cache and verifier-tier counts are summed in the parent (see cache_stats)
+        conn.send((status, payload, spans, dict(counters() - before)))
+
+
+def failed_result(task, reason, timed_out=False):
+    """Structured result in the same shape the agent itself would return."""
+    if task == "verify":
+        return {"verified": False, "reason": reason, "timed_out": timed_out}
+    return {
+        "solution": None,
+        "steps": [],
+        "confidence": 0.0,
+        "error": reason,
+        "cached": False,
+        "values": [],
+        "target": None,
+        "timed_out": timed_out
+    }
+
+
+class Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SympyWorkerPool:
+    """
+    Pre-warmed pool of processes that run solver_agent / verifier_agent.
+    Each call gets a deadline; a worker that overruns it is killed and
+    replaced, and the caller gets a "timed out" result instead of blocking.
+    """
+
+    def __init__(self, size=None, timeout=SOLVE_TIMEOUT):
+        self.size = size or max(1, (os.cpu_count() or 2) - 1)
+        self.timeout = timeout
+        # spawn: forking a multi-threaded Streamlit server is not safe
+        self.ctx = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        self.closed = False
+        self.counters = Counter()
+        self.counters_lock = threading.Lock()
+
+        for _ in range(self.size):
+            self.idle.put(Worker(self.ctx))
+
+    def run(self, task, *args, timeout=None, submitted=None):
+        """
+        submitted: time.monotonic() when the caller queued this call (e.g. on
+        a thread pool); the budget then also covers that wait.
+        """
+        budget = self.timeout if timeout is None else timeout
+        deadline = (time.monotonic() if submitted is None else submitted) + budget
+
+        # Waiting for a free worker counts against the same budget
+        try:
+            worker = self.idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            worker = None
+        if worker is not None and time.monotonic() >= deadline:
+            # Budget already spent queueing before run(); spare the worker
+            self.idle.put(worker)
+            worker = None
+        if worker is None:
+            return failed_result(task, f"Timed out after {budget:g}s waiting for a free solver worker.", timed_out=True)
+
+        try:
+            worker.conn.send((task, args, tracer.current_context()))
+            if worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                status, payload, spans, counters = worker.conn.recv()
+                self.idle.put(worker)
+                tracer.attach(spans)
+                with self.counters_lock:
+                    self.counters.update(counters)
+                if status == "ok":
+                    return payload
+                return failed_result(task, f"Math error: {payload}")
+        except (EOFError, OSError):
+            self.replace(worker)
+            return failed_result(task, "Solver worker crashed.")
+
+        self.replace(worker)
+        return failed_result(task, f"Timed out after {budget:g}s. The problem may be too complex to solve symbolically.", timed_out=True)
+
+    def cache_stats(self):
+        """Solve-cache hits / misses and verifier tier counts summed over all workers."""
+        with self.counters_lock:
+            counters = dict(self.counters)
+        hits, misses = counters.pop("cache_hits", 0), counters.pop("cache_misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "tiers": {name[len("tier_"):]: n for name, n in counters.items()}
+        }
+
+    def replace(self, worker):
+        worker.kill()
+        if not self.closed:
+            self.idle.put(Worker(self.ctx))
+
+    def shutdown(self):
+        self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SympyWorkerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def solve_with_deadline(problem, retrieved_chunks, timeout=None, submitted=None):
+    return get_pool().run("solve", problem, retrieved_chunks, timeout=timeout, submitted=submitted)
+
+
+def verify_with_deadline(problem, solution, values=None, target=None, timeout=None, submitted=None):
+    return get_pool().run("verify", problem, solution, values, target, timeout=timeout, submitted=submitted)
@@ -1,18 +1,29 @@
+import time
+from types import MappingProxyType
+
 import streamlit as st
 
 from agents.parser_agent import parser_agent
 from agents.intent_router import intent_router
-from agents.solver_agent import solver_agent
-from agents.verifier_agent import verifier_agent
+from agents.worker_pool import get_pool, solve_with_deadline, verify_with_deadline
 from agents.explainer_agent import explainer_agent
 from agents.memory_agent import memory_manager
+from agents.pipeline import component_versions, memo_key, memoizable, memory_memo, pipeline_memo, submit_stage
 
 from multimodal.text_input import get_text_input
 from multimodal.image_ocr import extract_text_from_image
-from multimodal.audio_asr import transcribe_audio
+from multimodal.audio_asr import transcribe_audio_stream
+from multimodal.result_cache import asr_cache, ocr_cache
 
 from rag.retriever import retrieve_context
 
+from model_registry import registry
+from model_server import model_client
+from tracing import tracer, waterfall
+
+# Start the SymPy workers once per server process, before the first solve
+get_pool()
+
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(page_title="AI Math Mentor", layout="wide")
@@ -28,14 +39,66 @@ if "extracted_data" not in st.session_state:
 if "parsed_output" not in st.session_state:
     st.session_state.parsed_output = None
 
+# Spans of the OCR / ASR run that produced the current text
+if "input_spans" not in st.session_state:
+    st.session_state.input_spans = []
+
 
 # ---------------- INPUT MODE ----------------
+# Modalities can be switched off per deployment (DISABLED_MODALITIES)
+input_modes = ["Text"]
+if registry.is_enabled("image"):
+    input_modes.append("Image")
+if registry.is_enabled("audio"):
+    input_modes.append("Audio")
+
 input_mode = st.selectbox(
     "Choose input mode",
-    ["Text", "Image", "Audio"]
+    input_modes
 )
 
 
+# ---------------- TRACING ----------------
+# One trace per script run, exported (see tracing.py) only if a stage ran
+run_span = tracer.start("streamlit_run", new_trace=True, input_mode=input_mode)
+
+
+def finish_trace():
+    tracer.end(run_span, export=bool(run_span.finished))
+
+
+def show_waterfall(spans, input_spans):
+    rows = waterfall(spans)
+    if not rows:
+        st.caption("No pipeline stage ran in this run.")
+    else:
+        for row in rows:
+            row["label"] = "· " * row["depth"] + row["name"]
+        st.vega_lite_chart({
+            "data": {"values": rows},
+            "mark": {"type": "bar", "tooltip": True},
+            "encoding": {
+                "y": {"field": "label", "type": "nominal", "sort": None, "title": None},
+                "x": {"field": "start_ms", "type": "quantitative", "title": "ms"},
+                "x2": {"field": "end_ms"},
+                "color": {"field": "depth", "type": "ordinal", "legend": None}
+            }
+        }, use_container_width=True)
+        top_level = [row for row in rows if row["depth"] == 0]
+        st.caption(" | ".join(f"{row['name']}: {row['duration_ms']:.1f} ms" for row in top_level))
+
+        # Critical path: stages that overlapped took less wall time than their sum
+        stage_ms = sum(row["duration_ms"] for row in top_level)
+        wall_ms = max(row["end_ms"] for row in top_level) - min(row["start_ms"] for row in top_level)
+        if stage_ms - wall_ms >= 1:
+            st.caption(f"⚡ {stage_ms:.0f} ms of stage work in {wall_ms:.0f} ms: "
+                       f"{stage_ms - wall_ms:.0f} ms saved by running stages concurrently")
+
+    if input_spans:
+        st.caption("Input extraction (earlier run): " + ", ".join(
+            f"{row['name']} {row['duration_ms']:.0f} ms" for row in waterfall(input_spans) if row["depth"] == 0))
+
+
 # ---------------- TEXT ----------------
 if input_mode == "Text":
     user_text = st.text_area("Enter math problem")
@@ -43,6 +106,7 @@ if input_mode == "Text":
     if st.button("Process Text"):
         st.session_state.extracted_data = get_text_input(user_text)
         st.session_state.parsed_output = None
+        st.session_state.input_spans = []
 
 
 # ---------------- IMAGE ----------------
@@ -53,8 +117,10 @@ elif input_mode == "Image":
         st.image(image_file, caption="Uploaded Image", width=700)
 
         if st.button("Extract Text"):
-            st.session_state.extracted_data = extract_text_from_image(image_file)
+            with tracer.span("ocr"):
+                st.session_state.extracted_data = extract_text_from_image(image_file)
             st.session_state.parsed_output = None
+            st.session_state.input_spans = list(run_span.finished)
 
 
 # ---------------- AUDIO ----------------
@@ -70,8 +136,40 @@ elif input_mode == "Audio":
         st.audio(audio_file)
 
         if st.button("Transcribe Audio"):
-            st.session_state.extracted_data = transcribe_audio(audio_file)
+            # Partial text shows up as each piece of a long recording finishes
+            progress = st.progress(0.0)
+            partial_text = st.empty()
+            with tracer.span("asr"):
+                for partial in transcribe_audio_stream(audio_file):
+                    progress.progress(partial["progress"])
+                    partial_text.caption(partial["text"] or "...")
+            progress.empty()
+            partial_text.empty()
+
+            st.session_state.extracted_data = {"text": partial["text"], "confidence": partial["confidence"]}
             st.session_state.parsed_output = None
+            st.session_state.input_spans = list(run_span.finished)
+
+
+# ---------------- MODEL WARM-UP ----------------
+# Models load on first use; only the WARM_UP_MODALITIES are loaded ahead,
+# in the background once the page is rendered, so text-only users never wait.
+# A running model server (model_server.py) answers for OCR, ASR and
+# embeddings, so those are not loaded into this process
+model_client.available()
+registry.warm_up()
+
+with st.sidebar:
+    st.markdown("### ⚙️ Models")
+    for name, state in registry.status().items():
+        st.caption(f"{name}: {state}")
+    for name, cache in (("OCR", ocr_cache), ("ASR", asr_cache)):
+        stats = cache.stats()
+        st.caption(f"{name} cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})")
+    stats = pipeline_memo.stats()
+    st.caption(f"Pipeline memo: {stats['size']} problems, {stats['hits']} hits / {stats['misses']} misses")
+    stats = get_pool().cache_stats()
+    st.caption(f"Solve cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})")
 
 
 # ---------------- PREVIEW & EDIT ----------------
@@ -90,7 +188,8 @@ if st.session_state.extracted_data:
         st.warning("⚠️ Low confidence — Human verification required (HITL)")
 
     if st.button("Run Parser Agent"):
-        st.session_state.parsed_output = parser_agent(edited_text)
+        with tracer.span("parser"):
+            st.session_state.parsed_output = parser_agent(edited_text)
 
 
 # ---------------- PARSER → RAG → SOLVER → VERIFIER ----------------
@@ -107,7 +206,8 @@ if st.session_state.parsed_output:
 
     else:
         # ---------------- INTENT DISPATCH ----------------
-        intent = intent_router(parsed_output)
+        with tracer.span("intent_router"):
+            intent = intent_router(parsed_output)
         
         # UI: Agent Workflow Trace
         with st.expander("🕵️ Agent Workflow Trace", expanded=False):
@@ -117,34 +217,79 @@ if st.session_state.parsed_output:
             3. **Solver/RAG**: {'Active' if intent == 'solve_math' else 'Related Concepts Only'}
             """)
 
+        # UI: Timing waterfall, filled in once the stages below have run
+        timing_panel = st.expander("⏱️ Timing Waterfall", expanded=False)
+
         if intent == "chitchat":
             st.warning("⚠️ Input ambiguous or off-topic.")
+            with timing_panel:
+                show_waterfall(run_span.finished, st.session_state.input_spans)
+            finish_trace()
             st.stop()
             
         elif intent == "explain_only":
              st.info("ℹ️ Explanation Mode: Showing related concepts.")
 
+        # ---------------- MEMOIZED STAGES ----------------
+        # Every click reruns this script; stage results for this problem
+        # (from any session) are reused, so reruns only redraw
+        stages_key = memo_key(parsed_output["problem_text"], intent, component_versions())
+        memoized = pipeline_memo.get(stages_key)
+        # A fresh dict per run: the memoized mapping is shared with other sessions
+        stages = dict(memoized) if memoized is not None else {}
+        run_span.set_attribute("memo_hit", memoized is not None)
+
+        # ---------------- CONCURRENT STAGES ----------------
+        # RAG, the memory lookup and the solve do not depend on each other
+        # (the solver ignores retrieved chunks), so whichever are not memoized
+        # start together on the stage pool and the page fills in as they finish
+        futures = {}
+        if registry.is_enabled("rag") and "retrieved_chunks" not in stages:
+            futures["rag"] = submit_stage(
+                "retrieve", retrieve_context, parsed_output["problem_text"], topic=parsed_output["topic"]
+            )
+        if intent == "solve_math":
+            # Memory lookups are refreshed whenever memory changes
+            memory_key = memo_key(parsed_output["problem_text"], "memory", memory_manager.revision)
+            memory_lookup = memory_memo.get(memory_key)
+            if memory_lookup is None:
+                futures["memory"] = submit_stage("memory", memory_manager.find_similar, parsed_output["problem_text"])
+            if "solver_output" not in stages:
+                # In a worker process, bounded by SOLVE_TIMEOUT from now, however
+                # long it waits for a stage thread
+                futures["solver"] = submit_stage(
+                    "solver", solve_with_deadline, parsed_output["problem_text"], [],
+                    submitted=time.monotonic(), span_attributes=lambda output: {"cached": output["cached"]}
+                )
+
         # ---------------- RAG RETRIEVAL ----------------
-        with st.expander("📚 View Related Math Concepts"):
-             try:
-                 retrieved_chunks = retrieve_context(parsed_output["problem_text"])
-                 
-                 if not retrieved_chunks:
-                     st.info("No specific knowledge found in RAG knowledge base.")
-
-                 for i, chunk in enumerate(retrieved_chunks):
-                     st.markdown(f"**Source {i+1}**")
-                     st.info(chunk)
-             except Exception as e:
-                 st.error(f"RAG Retrieval failed: {e}")
-                 retrieved_chunks = []
+        retrieved_chunks = []
+        if registry.is_enabled("rag"):
+            with st.expander("📚 View Related Math Concepts"):
+                 try:
+                     if "rag" in futures:
+                         stages["retrieved_chunks"] = futures["rag"].result()
+                     retrieved_chunks = stages["retrieved_chunks"]
+                     
+                     if not retrieved_chunks:
+                         st.info("No specific knowledge found in RAG knowledge base.")
+
+                     for i, chunk in enumerate(retrieved_chunks):
+                         st.markdown(f"**Source {i+1}**")
+                         st.info(chunk)
+                 except Exception as e:
+                     st.error(f"RAG Retrieval failed: {e}")
+                     retrieved_chunks = []
 
         # ---------------- SOLVER AGENT ----------------
         if intent == "solve_math":
             st.markdown("## 🧮 Step-by-Step Solution")
             
             # --- MEMORY CHECK ---
-            similar_entry = memory_manager.find_similar(parsed_output["problem_text"])
+            if "memory" in futures:
+                memory_lookup = {"entry": futures["memory"].result()}
+                memory_memo.put(memory_key, memory_lookup)
+            similar_entry = memory_lookup["entry"]
             if similar_entry:
                 st.success("💡 Found a similar solved problem in memory!")
                 with st.expander("View Past Solution"):
@@ -153,10 +298,9 @@ if st.session_state.parsed_output:
                     st.caption(f"Retrieved at: {similar_entry.get('timestamp', 'Unknown')}")
 
             # --- SOLVE ---
-            solver_output = solver_agent(
-                parsed_output["problem_text"],
-                retrieved_chunks if 'retrieved_chunks' in locals() else []
-            )
+            if "solver" in futures:
+                stages["solver_output"] = futures["solver"].result()
+            solver_output = stages["solver_output"]
 
             if solver_output["error"]:
                 st.error("❌ Could not solve")
@@ -164,11 +308,28 @@ if st.session_state.parsed_output:
                 st.warning("Please try rephrasing the problem.")
 
             else:
-                # ---------------- VERIFIER AGENT ----------------
-                verifier_output = verifier_agent(
-                    parsed_output["problem_text"],
-                    solver_output["solution"]
-                )
+                # ---------------- VERIFIER + EXPLAINER AGENTS ----------------
+                # Both only need the solution: verify in a worker while explaining here
+                verifier_future = None
+                if "verifier_output" not in stages:
+                    verifier_future = submit_stage(
+                        "verifier", verify_with_deadline,
+                        parsed_output["problem_text"],
+                        solver_output["solution"],
+                        solver_output["values"],
+                        solver_output["target"],
+                        submitted=time.monotonic()
+                    )
+                if "explanation" not in stages:
+                    with tracer.span("explainer"):
+                        stages["explanation"] = explainer_agent(
+                            parsed_output["problem_text"], 
+                            solver_output["steps"], 
+                            solver_output["solution"]
+                        )
+                if verifier_future is not None:
+                    stages["verifier_output"] = verifier_future.result()
+                verifier_output = stages["verifier_output"]
 
                 if verifier_output["verified"]:
                     st.markdown("### ✅ Result Verified")
@@ -181,12 +342,7 @@ if st.session_state.parsed_output:
 
                 # ---------------- EXPLAINER AGENT ----------------
                 with st.expander("🗣️ Explanation (AI)"):
-                    explanation = explainer_agent(
-                        parsed_output["problem_text"], 
-                        solver_output["steps"], 
-                        solver_output["solution"]
-                    )
-                    st.write(explanation)
+                    st.write(stages["explanation"])
 
                 st.success(f"**Final Answer:** {solver_output['solution']}")
                 
@@ -200,6 +356,7 @@ if st.session_state.parsed_output:
                         "problem_text": parsed_output["problem_text"],
                         "solution": solver_output["solution"],
                         "steps": solver_output["steps"],
+                        "topic": parsed_output["topic"],
                         "feedback": "positive"
                     })
                     st.toast("Saved to memory! The system has learned from this.")
@@ -210,6 +367,19 @@ if st.session_state.parsed_output:
                         "problem_text": parsed_output["problem_text"],
                         "solution": solver_output["solution"],
                         "steps": solver_output["steps"],
+                        "topic": parsed_output["topic"],
                         "feedback": "negative"
                     })
                     st.toast("Feedback recorded. Will improve next time.")
+
+        if memoized is None and memoizable(stages.get("solver_output", {}), stages.get("verifier_output")):
+            pipeline_memo.put(stages_key, MappingProxyType(dict(stages)))
+
+        with timing_panel:
+            if memoized is not None:
+                st.caption("♻️ Stored result reused for this problem; solver, verifier and explainer did not rerun.")
+            show_waterfall(run_span.finished, st.session_state.input_spans)
+
+
+# ---------------- TRACE EXPORT ----------------
+finish_trace()
@@ -0,0 +1,198 @@
+"""
+Headless batch mode: runs every problem in a JSONL or CSV file through the
+full agent pipeline and writes one JSONL result per problem, in input order.
+
+    python batch.py problems.jsonl results.jsonl --workers 8
+    python batch.py problems.jsonl results.jsonl --resume   # continue after a crash
+    python batch.py scans/ results.jsonl                    # OCR a folder of images
+
+Input records are JSON objects (or CSV rows) with a "problem" / "problem_text"
+/ "text" field and an optional "id". A directory input is OCR'd in batches,
+one problem per image, with the file name as id. SymPy work runs in the deadline-bounded
+worker pool, so runaway problems time out instead of stalling the batch.
+Only a bounded window of problems is in flight, whatever the input size.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from agents.parser_agent import detect_topic, normalize_math_text
+from agents.pipeline import run_pipeline
+from agents.worker_pool import SympyWorkerPool, SOLVE_TIMEOUT
+
+TEXT_FIELDS = ("problem", "problem_text", "text", "question")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def read_problems(path):
+    """Yields (id, text) lazily from a .jsonl or .csv file."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                text = next((row[k] for k in TEXT_FIELDS if row.get(k)), None)
+                if text is None and row:
+                    text = next(iter(row.values()))
+                yield row.get("id", i), text
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield i, line
+                continue
+            if isinstance(record, str):
+                yield i, record
+            elif isinstance(record, dict):
+                yield record.get("id", i), next((record[k] for k in TEXT_FIELDS if record.get(k)), None)
+            else:
+                # A number, list, true/false or null holds no problem text
+                print(f"⚠️ Line {i + 1}: skipped, expected an object or a string", file=sys.stderr)
+
+
+def read_scans(directory, skip=0):
+    """
+    Yields (file name, OCR text) for the images in a directory, in name
+    order, recognising OCR_BATCH_SIZE images per batched call.
+    """
+    from multimodal.image_ocr import OCR_BATCH_SIZE, extract_text_from_images
+
+    files = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))[skip:]
+    for start in range(0, len(files), OCR_BATCH_SIZE):
+        block = files[start:start + OCR_BATCH_SIZE]
+        results = extract_text_from_images(os.path.join(directory, f) for f in block)
+        for file, result in zip(block, results):
+            yield file, result["text"]
+
+
+def completed_count(path):
+    """
+    Number of results already written. A trailing partial line (from a crash
+    mid-write) is truncated away so the file can be appended to.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+        return data[:end].count(b"\n")
+
+
+def prefetch_context(records, block_size):
+    """
+    Warms the retrieval cache a block at a time with one batched
+    encode/search, so the per-problem retrieve_context calls are cache hits.
+    """
+    from rag.retriever import retrieve_context_batch
+
+    records = iter(records)
+    while True:
+        block = list(islice(records, block_size))
+        if not block:
+            return
+        texts = [normalize_math_text(text or "") for _, (_, text) in block]
+        retrieve_context_batch(texts, topics=[detect_topic(t) for t in texts])
+        yield from block
+
+
+def run_batch(input_path, output_path, workers=None, timeout=SOLVE_TIMEOUT, resume=False, use_rag=False, use_memory=False):
+    pool = SympyWorkerPool(size=workers, timeout=timeout)
+
+    retrieve = None
+    if use_rag:
+        from rag.retriever import retrieve_context
+        retrieve = retrieve_context
+
+    find_similar = None
+    if use_memory:
+        from agents.memory_agent import memory_manager
+        find_similar = memory_manager.find_similar
+
+    def process(index, problem_id, text):
+        result = run_pipeline(
+            text or "",
+            solve=lambda *args: pool.run("solve", *args),
+            verify=lambda *args: pool.run("verify", *args),
+            retrieve=retrieve,
+            find_similar=find_similar
+        )
+        if not use_rag:
+            result.pop("retrieved_chunks")
+        return dict({"index": index, "id": problem_id, "input": text}, **result)
+
+    skip = completed_count(output_path) if resume else 0
+    mode = "a" if resume else "w"
+
+    # One thread per worker process, so no problem's budget is spent queueing
+    # for a worker; the window bounds how many problems are held in memory.
+    threads = pool.size
+    window = threads * 4
+    written = 0
+    start = time.perf_counter()
+
+    try:
+        with open(output_path, mode, encoding="utf-8") as out, ThreadPoolExecutor(threads) as executor:
+            pending = deque()
+
+            def drain_one():
+                out.write(json.dumps(pending.popleft().result()) + "\n")
+                out.flush()
+
+            if os.path.isdir(input_path):
+                # Skipped scans are never OCR'd
+                records = enumerate(read_scans(input_path, skip), start=skip)
+            else:
+                records = islice(enumerate(read_problems(input_path)), skip, None)
+            if use_rag:
+                records = prefetch_context(records, window)
+
+            for index, (problem_id, text) in records:
+                pending.append(executor.submit(process, index, problem_id, text))
+                if len(pending) >= window:
+                    drain_one()
+                    written += 1
+
+            while pending:
+                drain_one()
+                written += 1
+    finally:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Processed {written} problems in {elapsed:.1f}s ({skip} skipped from checkpoint)", file=sys.stderr)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of math problems through the agent pipeline.")
+    parser.add_argument("input", help="JSONL or CSV file of problems, or a folder of scanned problems")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--workers", type=int, default=None, help="SymPy worker processes (default: CPUs - 1)")
+    parser.add_argument("--timeout", type=float, default=SOLVE_TIMEOUT, help="Per-problem solver/verifier budget in seconds")
+    parser.add_argument("--resume", action="store_true", help="Skip problems already present in the output file")
+    parser.add_argument("--rag", action="store_true", help="Also retrieve related concepts (loads the embedding model)")
+    parser.add_argument("--memory", action="store_true", help="Also look up similar problems in memory")
+    args = parser.parse_args()
+
+    run_batch(
+        args.input, args.output,
+        workers=args.workers, timeout=args.timeout, resume=args.resume,
+        use_rag=args.rag, use_memory=args.memory
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Recall@k and query latency of the IVF and HNSW index options against the
+exact flat index, at several corpus sizes.
+
+Vectors are synthetic (clustered, MiniLM-sized, L2-normalized) so the
+benchmark runs without the embedding model; the indexes are built with the
+same rag.build_index.make_index used for the real knowledge base.
+
+Run from the project root:
+    python -m benchmarks.bench_ann_index --sizes 10000 100000 300000
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from rag.build_index import make_index, train_index
+
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def synthetic_corpus(n, n_queries, rng, clusters=256):
+    centers = rng.normal(size=(clusters, DIM)).astype("float32")
+    labels = rng.integers(0, clusters, n + n_queries)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(n + n_queries, DIM)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:n], vectors[n:]
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall / latency benchmark for the RAG index types.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--output", help="Also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = []
+
+    for n in args.sizes:
+        corpus, queries = synthetic_corpus(n, args.queries, rng)
+        ids = np.arange(n, dtype="int64")
+
+        flat = make_index("flat", DIM, n)
+        flat.add_with_ids(corpus, ids)
+        truth, flat_ms = timed_search(flat, queries, args.k)
+        rows.append({"n": n, "index": "flat", "param": "-", "recall": 1.0, "ms_per_query": flat_ms, "build_s": 0.0})
+
+        start = time.perf_counter()
+        ivf = make_index("ivf", DIM, n)
+        train_index(ivf, corpus)
+        ivf.add_with_ids(corpus, ids)
+        ivf_build = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            found, ms = timed_search(ivf, queries, args.k)
+            rows.append({"n": n, "index": f"ivf{ivf.nlist}", "param": f"nprobe={nprobe}",
+                         "recall": recall_at_k(found, truth), "ms_per_query": ms, "build_s": ivf_build})
+
+        start = time.perf_counter()
+        hnsw = make_index("hnsw", DIM, n, hnsw_m=args.hnsw_m)
+        hnsw.add_with_ids(corpus, ids)
+        hnsw_build = time.perf_counter() - start
+        for ef in args.ef_search:
+            faiss.ParameterSpace().set_index_parameter(hnsw, "efSearch", ef)
+            found, ms = timed_search(hnsw, queries, args.k)
+            rows.append({"n": n, "index": f"hnsw{args.hnsw_m}", "param": f"efSearch={ef}",
+                         "recall": recall_at_k(found, truth), "ms_per_query": ms, "build_s": hnsw_build})
+
+    print(f"{'n':>8}  {'index':<9} {'param':<13} {'recall@' + str(args.k):>9} {'ms/query':>9} {'build s':>8}")
+    for row in rows:
+        print(f"{row['n']:>8}  {row['index']:<9} {row['param']:<13} {row['recall']:>9.3f} "
+              f"{row['ms_per_query']:>9.4f} {row['build_s']:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
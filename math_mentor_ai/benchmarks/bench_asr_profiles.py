@@ -0,0 +1,113 @@
+"""
+Real-time factor and word error rate of each Whisper inference profile
+(multimodal.audio_asr.ASR_PROFILES) on a local set of spoken math clips.
+
+The clip directory holds audio files, each with a reference transcript of
+the same name: algebra_01.wav + algebra_01.txt. Clips are not shipped with
+the repo; record a few problems from each topic.
+
+RTF is transcription time / audio duration (below 1 is faster than real
+time); model load time is reported separately. WER is word-level edit
+distance after lower-casing and dropping punctuation.
+
+Run from the project root:
+    python -m benchmarks.bench_asr_profiles --clips data/asr_clips
+    python -m benchmarks.bench_asr_profiles --clips data/asr_clips --profiles fast balanced
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from multimodal.audio_asr import (
+    ASR_PROFILES, SAMPLE_RATE, decode_audio, decode_options, trim_silence, whisper_model
+)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".aac", ".wma", ".flac")
+
+
+def load_clips(directory):
+    clips = []
+    for file in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(file)
+        reference = os.path.join(directory, stem + ".txt")
+        if ext.lower() not in AUDIO_EXTENSIONS or not os.path.exists(reference):
+            continue
+        with open(os.path.join(directory, file), "rb") as f:
+            audio = decode_audio(f.read(), ext)
+        with open(reference, "r", encoding="utf-8") as f:
+            clips.append({"name": file, "audio": audio, "reference": f.read()})
+    return clips
+
+
+def words(text):
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Substitutions + insertions + deletions turning hypothesis into reference."""
+    ref, hyp = words(reference), words(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+
+def run_profile(profile, clips):
+    start = time.perf_counter()
+    model = whisper_model(profile)
+    load_s = time.perf_counter() - start
+
+    options = decode_options(profile)
+    audio_s = compute_s = errors = ref_words = 0
+    for clip in clips:
+        audio = trim_silence(clip["audio"])
+        start = time.perf_counter()
+        text = model.transcribe(audio, **options).get("text", "")
+        compute_s += time.perf_counter() - start
+        audio_s += len(clip["audio"]) / SAMPLE_RATE
+
+        e, n = word_errors(clip["reference"], text)
+        errors += e
+        ref_words += n
+
+    return {
+        "profile": profile,
+        **ASR_PROFILES[profile],
+        "load_s": round(load_s, 2),
+        "rtf": round(compute_s / audio_s, 3) if audio_s else None,
+        "wer": round(errors / ref_words, 3) if ref_words else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whisper profile RTF / WER benchmark.")
+    parser.add_argument("--clips", required=True, help="Directory of audio clips with .txt references")
+    parser.add_argument("--profiles", nargs="+", choices=list(ASR_PROFILES), default=list(ASR_PROFILES))
+    parser.add_argument("--output", help="Also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    if not clips:
+        parser.error(f"No audio clips with matching .txt transcripts in {args.clips}")
+
+    total_s = sum(len(c["audio"]) for c in clips) / SAMPLE_RATE
+    print(f"{len(clips)} clips, {total_s:.1f} s of audio")
+
+    rows = [run_profile(profile, clips) for profile in args.profiles]
+
+    print(f"{'profile':<10} {'model':<9} {'lang':<5} {'beam':>4} {'int8':>5} {'load s':>7} {'RTF':>6} {'WER':>6}")
+    for row in rows:
+        print(f"{row['profile']:<10} {row['model']:<9} {row['language'] or 'auto':<5} {row['beam_size'] or 1:>4} "
+              f"{'yes' if row['quantize'] else 'no':>5} {row['load_s']:>7.2f} {row['rtf']:>6.3f} {row['wer']:>6.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Load time and private memory of the RAG index, chunk store and BM25 index:
+the old read_index + chunks.pkl + bm25.json against the memory-mapped index,
+chunk store and bm25.bin.
+
+A synthetic KB (random MiniLM-sized vectors, ~500 byte chunks) is written in
+both formats to a temporary directory, then each format is loaded in a fresh
+interpreter that looks up a few chunks and runs one search of each kind.
+Module imports happen before the timer starts. Private memory
+(RssAnon) is what each extra worker process pays; mapped file pages are
+shared through the page cache.
+
+Run from the project root:
+    python -m benchmarks.bench_index_load --chunks 10000 100000
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from rag.build_index import make_index
+from rag.chunk_store import write_chunk_store
+from rag.lexical import BM25Index, tokenize
+
+DIM = 384  # all-MiniLM-L6-v2
+
+PROBE = r"""
+import json, os, pickle, re, sys, time
+import faiss, numpy as np
+
+def rss_mb(field):
+    status = open("/proc/self/status").read()
+    return round(int(re.search(field + r":\s+(\d+)", status).group(1)) / 1024, 1)
+
+sys.path.insert(0, ROOT)
+from rag.retriever import read_index
+from rag.chunk_store import open_chunk_store
+from rag.lexical import BM25Index
+
+base = rss_mb("RssAnon")
+start = time.perf_counter()
+if FORMAT == "pickle":
+    index = faiss.read_index(os.path.join(PATH, "math.index"))
+    with open(os.path.join(PATH, "chunks.pkl"), "rb") as f:
+        chunks = pickle.load(f)
+    bm25 = BM25Index.load_json(os.path.join(PATH, "bm25.json"))
+else:
+    index = read_index(os.path.join(PATH, "math.index"))
+    chunks = open_chunk_store(PATH)
+    bm25 = BM25Index.load(os.path.join(PATH, "bm25.bin"))
+load_ms = (time.perf_counter() - start) * 1000
+
+_, ids = index.search(np.random.default_rng(0).random((1, index.d), dtype="float32"), 3)
+texts = [chunks[int(i)] for i in ids[0]]
+hits = bm25.search("x + 1 = 2", 3)
+print(json.dumps({"load_ms": round(load_ms, 1), "private_mb": round(rss_mb("RssAnon") - base, 1)}))
+"""
+
+
+def write_kb(path, n, rng):
+    vectors = rng.random((n, DIM), dtype="float32")
+    ids = np.arange(n, dtype="int64") * 7919  # sparse ids, like content hashes
+    words = [f"term{i}" for i in range(5000)]
+    chunks = {int(cid): f"Chunk {cid}: " + "x + 1 = 2, so x = 1. " * 12 + " ".join(rng.choice(words, 40))
+              for cid in ids}
+
+    import faiss
+
+    index = make_index("flat", DIM, n)
+    index.add_with_ids(vectors, ids)
+    faiss.write_index(index, os.path.join(path, "math.index"))
+
+    # Chunk store first: it removes a chunks.pkl it finds
+    write_chunk_store(path, chunks)
+    with open(os.path.join(path, "chunks.pkl"), "wb") as f:
+        pickle.dump(chunks, f)
+
+    BM25Index.build(chunks).save(os.path.join(path, "bm25.bin"))
+    write_legacy_bm25(os.path.join(path, "bm25.json"), chunks)
+
+
+def write_legacy_bm25(path, chunks):
+    """The JSON layout BM25Index used before bm25.bin."""
+    postings, doc_lengths = {}, {}
+    for cid, text in chunks.items():
+        tokens = tokenize(text)
+        doc_lengths[str(cid)] = len(tokens)
+        for term in set(tokens):
+            postings.setdefault(term, []).append([cid, tokens.count(term)])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"k1": 1.5, "b": 0.75, "doc_lengths": doc_lengths, "postings": postings}, f)
+
+
+def probe(path, fmt):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = f"FORMAT = {fmt!r}\nPATH = {path!r}\nROOT = {root!r}\n" + PROBE
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG index / chunk store / BM25 load time and memory.")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8}  {'format':<7} {'load ms':>9} {'private MB':>11}")
+    for n in args.chunks:
+        with tempfile.TemporaryDirectory() as path:
+            write_kb(path, n, rng)
+            for fmt in ("pickle", "mmap"):
+                row = probe(path, fmt)
+                print(f"{n:>8}  {fmt:<7} {row['load_ms']:>9.1f} {row['private_mb']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
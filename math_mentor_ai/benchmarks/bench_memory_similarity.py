@@ -0,0 +1,113 @@
+"""
+Compares MemoryManager.find_similar (n-gram index) against the original
+full-file difflib scan on a synthetic history.
+
+Run from the project root:
+    python -m benchmarks.bench_memory_similarity --entries 20000 --queries 200
+"""
+import argparse
+import difflib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from agents.memory_agent import MemoryManager
+from agents.memory_store import MemoryStore
+
+
+def random_problem(rng):
+    a, b, c = rng.randint(1, 99), rng.randint(-99, 99), rng.randint(-99, 99)
+    var = rng.choice("xyzabt")
+    kind = rng.random()
+    if kind < 0.4:
+        return f"{a}{var}{b:+d}={c}"
+    if kind < 0.7:
+        return f"{var}^2{b:+d}{var}{c:+d}=0"
+    if kind < 0.9:
+        return f"{b}{var}+{a}-{c}({a}{var}+{b})"
+    return f"{a}*{b}+{c}"
+
+
+def scan_similar(filepath, current_problem, threshold=0.8):
+    """The original implementation: decode every line and difflib it."""
+    best_match = None
+    highest_ratio = 0.0
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            past_problem = data.get("problem_text", "")
+            ratio = difflib.SequenceMatcher(None, current_problem.lower(), past_problem.lower()).ratio()
+            if ratio > highest_ratio:
+                highest_ratio = ratio
+                best_match = data
+    return best_match if highest_ratio >= threshold else None
+
+
+def timed(fn, queries):
+    durations, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(fn(q))
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations, results
+
+
+def summary(name, durations):
+    durations = sorted(durations)
+    p95 = durations[int(0.95 * (len(durations) - 1))]
+    print(f"{name:<8} mean {statistics.mean(durations):9.3f} ms   p95 {p95:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    history = [random_problem(rng) for _ in range(args.entries)]
+
+    # Half the queries are near-repeats of past problems, half are new
+    queries = []
+    for i in range(args.queries):
+        if i % 2:
+            q = list(rng.choice(history))
+            q[rng.randrange(len(q))] = rng.choice("0123456789")
+            queries.append("".join(q))
+        else:
+            queries.append(random_problem(rng))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for i, problem in enumerate(history):
+                f.write(json.dumps({"problem_text": problem, "solution": str(i)}) + "\n")
+
+        db_path = os.path.join(tmp, "memory.db")
+        MemoryStore(db_path).seed_from_jsonl(path)
+
+        start = time.perf_counter()
+        manager = MemoryManager(filepath=db_path, legacy_file=None)
+        print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms for {args.entries} entries")
+
+        scan_ms, scan_results = timed(lambda q: scan_similar(path, q), queries)
+        index_ms, index_results = timed(manager.find_similar, queries)
+
+    agree = sum(
+        (a or {}).get("problem_text") == (b or {}).get("problem_text")
+        for a, b in zip(scan_results, index_results)
+    )
+    summary("scan", scan_ms)
+    summary("index", index_ms)
+    print(f"agreement: {agree}/{len(queries)} queries return the same best match")
+
+
+if __name__ == "__main__":
+    main()
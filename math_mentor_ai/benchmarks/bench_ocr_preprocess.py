@@ -0,0 +1,110 @@
+"""
+OCR latency and accuracy with and without the preprocessing stage
+(multimodal.image_preprocess) on a local set of worksheet photos.
+
+The sample directory holds images, each with a reference transcript of the
+same name: page_01.jpg + page_01.txt. Samples are not shipped with the repo.
+Accuracy is the character error rate after lower-casing and removing
+whitespace, so line breaks and spacing do not count.
+
+Run from the project root:
+    python -m benchmarks.bench_ocr_preprocess --samples data/ocr_samples
+    python -m benchmarks.bench_ocr_preprocess --samples data/ocr_samples --target-height 24 32 48
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+from PIL import Image
+
+from model_registry import registry
+from multimodal.image_preprocess import TARGET_TEXT_HEIGHT, preprocess_image
+import multimodal.image_ocr  # noqa: F401  registers the reader
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def load_samples(directory):
+    samples = []
+    for file in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(file)
+        reference = os.path.join(directory, stem + ".txt")
+        if ext.lower() in IMAGE_EXTENSIONS and os.path.exists(reference):
+            with open(reference, "r", encoding="utf-8") as f:
+                samples.append({"name": file, "path": os.path.join(directory, file), "reference": f.read()})
+    return samples
+
+
+def chars(text):
+    return re.sub(r"\s+", "", text.lower())
+
+
+def char_errors(reference, hypothesis):
+    ref, hyp = chars(reference), chars(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+
+def run_variant(reader, samples, target_height):
+    """target_height None: the raw RGB upload, as before preprocessing existed."""
+    prep_s = ocr_s = errors = ref_chars = 0
+    for sample in samples:
+        start = time.perf_counter()
+        if target_height is None:
+            image = np.array(Image.open(sample["path"]).convert("RGB"))
+        else:
+            image, _ = preprocess_image(sample["path"], target_text_height=target_height)
+        prep_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        text = " ".join(text for _, text, _ in reader.readtext(image))
+        ocr_s += time.perf_counter() - start
+
+        e, n = char_errors(sample["reference"], text)
+        errors += e
+        ref_chars += n
+
+    n = len(samples)
+    return {
+        "variant": "raw" if target_height is None else f"preprocessed@{target_height}px",
+        "prep_ms": round(prep_s * 1000 / n, 1),
+        "ocr_ms": round(ocr_s * 1000 / n, 1),
+        "total_ms": round((prep_s + ocr_s) * 1000 / n, 1),
+        "cer": round(errors / ref_chars, 4) if ref_chars else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR preprocessing latency / accuracy benchmark.")
+    parser.add_argument("--samples", required=True, help="Directory of images with .txt references")
+    parser.add_argument("--target-height", type=int, nargs="+", default=[TARGET_TEXT_HEIGHT],
+                        help="Text heights (px) to preprocess to")
+    parser.add_argument("--output", help="Also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    if not samples:
+        parser.error(f"No images with matching .txt transcripts in {args.samples}")
+
+    reader = registry.get("ocr")
+    rows = [run_variant(reader, samples, h) for h in [None] + args.target_height]
+
+    print(f"{len(samples)} images")
+    print(f"{'variant':<18} {'prep ms':>8} {'ocr ms':>9} {'total ms':>9} {'CER':>7}")
+    for row in rows:
+        print(f"{row['variant']:<18} {row['prep_ms']:>8.1f} {row['ocr_ms']:>9.1f} {row['total_ms']:>9.1f} {row['cer']:>7.4f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Stage-level latency of the agent pipeline (parser, intent router, RAG,
+memory lookup, solver, verifier, explainer) over a labelled corpus, with
+p50 / p95 / p99 per stage, end to end and per problem category.
+
+The corpus (benchmarks/corpus/pipeline_problems.jsonl) has linear,
+quadratic, simplification and arithmetic problems, each with the answer
+the pipeline gave when it was recorded; changed answers are listed so a
+"speed-up" that breaks results does not go unnoticed.
+
+By default every run is cold: the solve cache, the parsed-problem cache
+and SymPy's internal cache are cleared before each problem. Results can be stored as JSON and later
+runs compared against them, exiting non-zero when a stage regresses.
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --threshold 0.25
+    python -m benchmarks.bench_pipeline --rag --memory --repeat 10
+    python -m benchmarks.bench_pipeline --rag --memory --sequential   # compare with the line above
+
+The "saved" row is the critical-path time the concurrent stage schedule
+took off each request (sum of stage timings minus end to end).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import sympy
+from sympy.core.cache import clear_cache
+
+from agents.pipeline import run_pipeline
+from agents.problem import parse_problem
+from agents.solve_cache import solve_cache
+from agents.worker_pool import SympyWorkerPool
+from tracing import tracer
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "pipeline_problems.jsonl")
+STAGES = ["parser", "intent_router", "retrieve", "memory", "solver", "verifier", "explainer", "total"]
+# Critical-path time saved by running stages side by side; growth is not a regression
+SAVED = "saved"
+PERCENTILES = (50, 95, 99)
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(samples):
+    """{stage: {"n", "mean", "p50", "p95", "p99"}} in ms, for stages that ran."""
+    summary = {}
+    for stage in STAGES + [SAVED]:
+        values = samples.get(stage)
+        if not values:
+            continue
+        summary[stage] = {
+            "n": len(values),
+            "mean": round(float(np.mean(values)), 3),
+            **{f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+        }
+    return summary
+
+
+def run_corpus(problems, repeat, warm, retrieve, find_similar, concurrent, pool=None):
+    overall = defaultdict(list)
+    by_category = defaultdict(lambda: defaultdict(list))
+    changed = set()
+
+    solve = {}
+    if pool is not None:
+        solve = {"solve": lambda *args: pool.run("solve", *args), "verify": lambda *args: pool.run("verify", *args)}
+
+    for _ in range(repeat):
+        for problem in problems:
+            if not warm:
+                solve_cache.clear()
+                parse_problem.cache_clear()
+                clear_cache()
+
+            result = run_pipeline(problem["problem"], retrieve=retrieve, find_similar=find_similar,
+                                  concurrent=concurrent, **solve)
+
+            for stage, ms in result["timings"].items():
+                overall[stage].append(ms)
+                by_category[problem["category"]][stage].append(ms)
+            overall[SAVED].append(result["saved_ms"])
+            if result["solution"] != problem.get("expected"):
+                changed.add(problem["id"])
+
+    return {
+        "stages": summarize(overall),
+        "categories": {cat: summarize(samples) for cat, samples in sorted(by_category.items())},
+        "answers_changed": sorted(changed)
+    }
+
+
+def regressions(current, baseline, threshold, min_delta_ms):
+    """Stages whose p50 or p95 grew by more than threshold (and min_delta_ms)."""
+    found = []
+    for stage, stats in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None or stage == SAVED:
+            continue
+        for key in ("p50", "p95"):
+            delta = stats[key] - base[key]
+            if delta > min_delta_ms and stats[key] > base[key] * (1 + threshold):
+                found.append(f"{stage} {key}: {base[key]:.2f} -> {stats[key]:.2f} ms (+{delta / base[key]:.0%})")
+    return found
+
+
+def print_table(title, summary):
+    print(f"\n{title}")
+    print(f"  {'stage':<14} {'n':>5} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, s in summary.items():
+        print(f"  {stage:<14} {s['n']:>5} {s['mean']:>9.3f} {s['p50']:>9.3f} {s['p95']:>9.3f} {s['p99']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark of the agent pipeline.")
+    parser.add_argument("--corpus", default=CORPUS, help="JSONL corpus (id, category, problem, expected)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the corpus")
+    parser.add_argument("--warm", action="store_true", help="Keep the solve and SymPy caches between problems")
+    parser.add_argument("--rag", action="store_true", help="Include retrieval (loads the embedding model and index)")
+    parser.add_argument("--memory", action="store_true", help="Include the memory similarity lookup")
+    parser.add_argument("--sequential", action="store_true", help="Run stages one after another (no stage pool)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Solve / verify in this many SymPy worker processes, as the app and batch mode do "
+                             "(their caches are not cleared between problems)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative p50/p95 growth per stage")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore growth smaller than this (noise floor)")
+    args = parser.parse_args()
+
+    # The benchmark must not write to the persistent SQLite solve cache or the trace file
+    solve_cache.persist_path = None
+    tracer.path = None
+    os.environ["SOLVE_CACHE_FILE"] = ""   # inherited by worker processes
+
+    retrieve = find_similar = None
+    if args.rag:
+        from rag.retriever import retrieve_context
+        retrieve = retrieve_context
+    if args.memory:
+        from agents.memory_agent import memory_manager
+        find_similar = memory_manager.find_similar
+
+    problems = load_corpus(args.corpus)
+
+    # One untimed pass: imports, lazy model loads and first-call setup
+    concurrent = not args.sequential
+    pool = SympyWorkerPool(size=args.workers) if args.workers else None
+    try:
+        run_corpus(problems, 1, args.warm, retrieve, find_similar, concurrent, pool)
+
+        start = time.perf_counter()
+        results = run_corpus(problems, args.repeat, args.warm, retrieve, find_similar, concurrent, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    results["meta"] = {
+        "corpus": os.path.basename(args.corpus),
+        "problems": len(problems),
+        "repeat": args.repeat,
+        "mode": "warm" if args.warm else "cold",
+        "rag": args.rag,
+        "memory": args.memory,
+        "concurrent": concurrent,
+        "workers": args.workers,
+        "wall_s": round(time.perf_counter() - start, 2),
+        "python": platform.python_version(),
+        "sympy": sympy.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+    print_table(f"All problems ({len(problems)} x {args.repeat}, {results['meta']['mode']}, "
+                f"{'concurrent' if concurrent else 'sequential'} stages)", results["stages"])
+    for category, summary in results["categories"].items():
+        print_table(category, {k: v for k, v in summary.items() if k in ("solver", "verifier", "total")})
+
+    if results["answers_changed"]:
+        print(f"\n⚠️ Answers differ from the corpus for: {', '.join(results['answers_changed'])}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.threshold, args.min_delta_ms)
+        if found:
+            print("\n❌ Regressions against " + args.baseline + ":")
+            for line in found:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\n✅ No stage regressed more than {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
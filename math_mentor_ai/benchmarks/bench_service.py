@@ -0,0 +1,144 @@
+"""
+Load test for the HTTP solve service (server.py): keeps --concurrency
+keep-alive connections busy posting problems from the pipeline corpus to
+/solve/text and reports throughput, latency percentiles of the answered
+requests, and how many were shed with 503.
+
+Start the service first, then run from the project root:
+    python server.py --port 8000 --no-rag
+    python -m benchmarks.bench_service --concurrency 16 --requests 800
+    python -m benchmarks.bench_service --concurrency 64 --duration 30 --output load.json
+
+Repeated problems hit the solver cache inside the worker processes; pass
+--unique to make every request a different equation.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Same corpus as bench_pipeline; not imported from there so the client stays free of SymPy
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "pipeline_problems.jsonl")
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def post(reader, writer, host, path, payload):
+    """(status, seconds) for one request on an open keep-alive connection."""
+    body = json.dumps(payload).encode("utf-8")
+    start = time.perf_counter()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status, time.perf_counter() - start
+
+
+async def client(url, problems, next_index, stop, latencies, statuses):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        while not stop():
+            text = problems(next_index())
+            try:
+                status, seconds = await post(reader, writer, parts.hostname, "/solve/text", {"text": text})
+            except (ConnectionError, asyncio.IncompleteReadError, IndexError, ValueError):
+                statuses["connection_error"] += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                continue
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(seconds * 1000)
+            elif status == 503:
+                # Honour the service's Retry-After loosely, as a real client would
+                await asyncio.sleep(0.05)
+    finally:
+        writer.close()
+
+
+async def run_load(url, corpus, concurrency, requests, duration, unique):
+    latencies, statuses = [], Counter()
+    counter = iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration if duration else None
+    issued = [0]
+
+    def next_index():
+        issued[0] += 1
+        return next(counter)
+
+    def stop():
+        if deadline is not None:
+            return time.perf_counter() >= deadline
+        return issued[0] >= requests
+
+    def problems(i):
+        if unique:
+            # A different constant per request, so no cache can answer it
+            return f"solve {i % 97 + 2}x + {i} = {3 * i + 1}"
+        return corpus[i % len(corpus)]["problem"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, problems, next_index, stop, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    answered = statuses[200]
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": sum(statuses.values()),
+        "answered": answered,
+        "shed": statuses[503],
+        "throughput_rps": round(answered / elapsed, 1) if elapsed else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        **{f"p{p}_ms": round(float(np.percentile(latencies, p)), 1) if latencies else None for p in (50, 95, 99)}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP solve service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="Open connections (several values: one run each)")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per run (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds per run instead of a request count")
+    parser.add_argument("--unique", action="store_true", help="Never repeat a problem (defeats the solver cache)")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--output", help="Also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    rows = [asyncio.run(run_load(args.url, corpus, c, args.requests, args.duration, args.unique))
+            for c in args.concurrency]
+
+    print(f"{'conc':>5} {'answered':>9} {'shed':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(f"{row['concurrency']:>5} {row['answered']:>9} {row['shed']:>6} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms'] or 0:>8.1f} {row['p95_ms'] or 0:>8.1f} {row['p99_ms'] or 0:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures startup cost of the app's modules: import time and peak RSS with
+lazy model loading, and the cost of loading every model up front (what the
+app used to pay at import time).
+
+Run from the project root:
+    python -m benchmarks.bench_startup            # lazy: import only
+    python -m benchmarks.bench_startup --eager    # import, then load every model
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, sys, time
+
+def rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+start = time.perf_counter()
+import agents.pipeline, agents.memory_agent
+import multimodal.image_ocr, multimodal.audio_asr, rag.retriever
+from model_registry import registry
+report = {"import_s": round(time.perf_counter() - start, 2), "import_rss_mb": rss_mb()}
+
+if EAGER:
+    start = time.perf_counter()
+    for name, state in registry.status().items():
+        if state != "disabled":
+            registry.get(name)
+    report["load_s"] = round(time.perf_counter() - start, 2)
+    report["load_times_s"] = registry.load_times
+    report["loaded_rss_mb"] = rss_mb()
+
+report["status"] = registry.status()
+print(json.dumps(report))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time / RSS of the app modules.")
+    parser.add_argument("--eager", action="store_true", help="Also load every enabled model")
+    args = parser.parse_args()
+
+    # A fresh interpreter, so nothing is already imported or cached
+    code = f"EAGER = {args.eager}\n" + PROBE
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    print(json.dumps(json.loads(output.splitlines()[-1]), indent=2))
+
+
+if __name__ == "__main__":
+    main()
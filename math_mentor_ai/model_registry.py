@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+# Comma-separated modalities to switch off entirely, e.g. "audio,image"
+DISABLED_MODALITIES = {
+    m.strip().lower()
+    for m in os.environ.get("DISABLED_MODALITIES", "").split(",")
+    if m.strip()
+}
+
+# Comma-separated modalities whose models warm_up() loads ahead of first use,
+# e.g. "rag"; the rest load when first needed, so a process only holds what it uses
+WARM_UP_MODALITIES = {
+    m.strip().lower()
+    for m in os.environ.get("WARM_UP_MODALITIES", "").split(",")
+    if m.strip()
+}
+
+
+class ModelDisabledError(RuntimeError):
+    pass
+
+
+class ModelRegistry:
+    """
+    Loads heavy models (OCR, ASR, embeddings, FAISS index) on first use
+    instead of at import time. Models of the warm-up modalities can also be
+    loaded in a background thread once the UI is up, and status() reports
+    readiness.
+    """
+
+    def __init__(self, disabled=DISABLED_MODALITIES, warm=WARM_UP_MODALITIES):
+        self.disabled = set(disabled)
+        self.warm = set(warm)
+        self.loaders = {}      # name -> (modality, loader)
+        self.models = {}
+        self.errors = {}
+        self.load_times = {}
+        self.locks = {}
+        self.loading = set()
+        self.warm_thread = None
+        self.remote = set()    # served by the shared model server (model_server.py)
+        self.lock = threading.Lock()
+
+    def register(self, name, modality, loader):
+        with self.lock:
+            self.loaders[name] = (modality, loader)
+            self.locks.setdefault(name, threading.Lock())
+
+    def is_enabled(self, modality):
+        return modality not in self.disabled
+
+    def mark_remote(self, names):
+        """Models a model server answers for; they are not warmed up in this process."""
+        self.remote = set(names)
+
+    def is_remote(self, name):
+        # "whisper:<profile>" is served along with "whisper"
+        return name.split(":")[0] in self.remote
+
+    def get(self, name):
+        modality, loader = self.loaders[name]
+        if not self.is_enabled(modality):
+            raise ModelDisabledError(f"The '{modality}' modality is disabled in this deployment.")
+
+        model = self.models.get(name)
+        if model is not None:
+            return model
+
+        # One loader per model; concurrent callers wait for the same load
+        with self.locks[name]:
+            if name in self.models:
+                return self.models[name]
+
+            self.loading.add(name)
+            start = time.perf_counter()
+            try:
+                model = loader()
+            except Exception as e:
+                self.errors[name] = str(e)
+                raise
+            finally:
+                self.loading.discard(name)
+
+            self.models[name] = model
+            self.errors.pop(name, None)
+            self.load_times[name] = round(time.perf_counter() - start, 2)
+            return model
+
+    def status(self):
+        """name -> "disabled" | "remote" | "ready" | "loading" | "failed" | "not loaded"."""
+        report = {}
+        for name, (modality, _) in self.loaders.items():
+            if not self.is_enabled(modality):
+                report[name] = "disabled"
+            elif self.is_remote(name) and name not in self.models:
+                report[name] = "remote"
+            elif name in self.models:
+                report[name] = "ready"
+            elif name in self.loading:
+                report[name] = "loading"
+            elif name in self.errors:
+                report[name] = "failed"
+            else:
+                report[name] = "not loaded"
+        return report
+
+    def warm_up(self, names=None):
+        """
+        Loads models in a background thread: names, or those of the
+        WARM_UP_MODALITIES. Safe to call on every rerun.
+        """
+        with self.lock:
+            if self.warm_thread is not None:
+                return self.warm_thread
+
+            names = list(names or (name for name, (modality, _) in self.loaders.items() if modality in self.warm))
+
+            def load_all():
+                for name in names:
+                    if self.is_enabled(self.loaders[name][0]) and not self.is_remote(name):
+                        try:
+                            self.get(name)
+                        except Exception:
+                            pass  # recorded in self.errors
+
+            self.warm_thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+            self.warm_thread.start()
+            return self.warm_thread
+
+
+# Singleton instance
+registry = ModelRegistry()
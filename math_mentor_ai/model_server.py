@@ -0,0 +1,313 @@
+"""
+Shared model server: one local daemon that owns Whisper, EasyOCR and the
+MiniLM embedder, so several app / service / batch processes on a machine
+do not each load their own copy.
+
+    python model_server.py                      # all enabled models
+    python model_server.py --models embed,ocr   # only some of them
+
+It listens on a Unix socket (MODEL_SERVER_SOCKET). Requests arriving from
+all clients within MODEL_SERVER_BATCH_MS are run together: embedding
+requests are concatenated into one encode() call and OCR images go through
+EasyOCR's readtext_batched; Whisper has no batched decode, so ASR requests
+are run one after another on the single loaded model.
+
+Clients need no configuration: transcribe_audio, extract_text_from_image(s)
+and retrieve_context use the daemon whenever its socket answers, and fall
+back to loading the model in-process when it does not.
+"""
+import argparse
+import os
+import queue
+import secrets
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from model_registry import registry
+
+# Unix socket of the daemon (empty: never use one); its auth key is in <socket>.key
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "data/model_server.sock")
+BATCH_WINDOW_MS = float(os.environ.get("MODEL_SERVER_BATCH_MS", "10"))    # how long a batch waits for more requests
+MAX_BATCH = int(os.environ.get("MODEL_SERVER_MAX_BATCH", "64"))           # requests per batch
+TIMEOUT = float(os.environ.get("MODEL_SERVER_TIMEOUT", "300"))            # seconds a client waits for a reply
+RETRY_S = 5.0      # after a failed connection, run locally this long before trying again
+
+# Request type -> registry model it needs
+OPS = {"embed": "embedder", "ocr": "ocr", "transcribe": "whisper"}
+
+
+def key_path(path):
+    return path + ".key"
+
+
+# ---------------- DAEMON ----------------
+def run_embed(payloads):
+    """Each payload is a list of texts; all of them are encoded in one call."""
+    texts = [text for payload in payloads for text in payload]
+    vectors = np.asarray(registry.get("embedder").encode(texts), dtype="float32")
+    results, start = [], 0
+    for payload in payloads:
+        results.append(vectors[start:start + len(payload)])
+        start += len(payload)
+    return results
+
+
+def run_ocr(payloads):
+    """Each payload is a list of preprocessed image arrays; all of them share readtext_batched calls."""
+    from multimodal.image_ocr import readtext_many
+
+    arrays = [array for payload in payloads for array in payload]
+    found = readtext_many(registry.get("ocr"), arrays)
+    results, start = [], 0
+    for payload in payloads:
+        results.append(found[start:start + len(payload)])
+        start += len(payload)
+    return results
+
+
+def run_transcribe(payloads):
+    """Each payload is (16 kHz audio, profile); Whisper decodes them one at a time."""
+    from multimodal.audio_asr import decode_options, whisper_model
+
+    return [
+        whisper_model(profile).transcribe(audio, **decode_options(profile)).get("text", "")
+        for audio, profile in payloads
+    ]
+
+
+HANDLERS = {"embed": run_embed, "ocr": run_ocr, "transcribe": run_transcribe}
+
+
+class ModelServer:
+    """
+    One thread per client connection reads requests and queues them by
+    type; one thread per type drains its queue in batches, so every model
+    is used by a single thread and sees requests from all clients together.
+    """
+
+    def __init__(self, path=MODEL_SERVER_SOCKET, ops=None, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.path = path
+        self.ops = [op for op in (ops or OPS) if registry.is_enabled(registry.loaders[OPS[op]][0])]
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queues = {op: queue.Queue() for op in self.ops}
+        self.batches = {op: [] for op in self.ops}    # sizes of recent batches, for ping
+
+    def batch_loop(self, op):
+        q = self.queues[op]
+        while True:
+            items = [q.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.batches[op] = (self.batches[op] + [len(items)])[-100:]
+            try:
+                results = HANDLERS[op]([payload for payload, _ in items])
+            except Exception as e:
+                for _, reply in items:
+                    reply.set_exception(e)
+                continue
+            for (_, reply), result in zip(items, results):
+                reply.set_result(result)
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if op == "ping":
+                    conn.send(("ok", {"ops": self.ops, "models": registry.status(), "batches": self.batches}))
+                    continue
+                if op not in self.queues:
+                    conn.send(("error", f"'{op}' is not served here"))
+                    continue
+
+                reply = Future()
+                self.queues[op].put((payload, reply))
+                try:
+                    conn.send(("ok", reply.result()))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def listen(self):
+        """Creates the socket (owner-only) and a fresh auth key next to it."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            if ping(self.path) is not None:
+                raise RuntimeError(f"A model server is already running on {self.path}")
+            os.remove(self.path)    # left behind by a daemon that died
+
+        authkey = secrets.token_bytes(32)
+        old_umask = os.umask(0o177)
+        try:
+            with open(key_path(self.path), "wb") as f:
+                f.write(authkey)
+            return Listener(self.path, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(old_umask)
+
+    def serve(self, warm_up=True):
+        listener = self.listen()
+        if warm_up:
+            for op in list(self.ops):
+                try:
+                    registry.get(OPS[op])
+                except Exception as e:
+                    # Not offered, so clients keep using their own copy
+                    print(f"⚠️ {OPS[op]} failed to load, not serving '{op}': {e}", flush=True)
+                    self.ops.remove(op)
+        for op in self.ops:
+            threading.Thread(target=self.batch_loop, args=(op,), name=f"batch-{op}", daemon=True).start()
+
+        print(f"✅ Model server on {self.path} ({', '.join(self.ops)})", flush=True)
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    continue    # failed authentication or a client that hung up
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            for path in (self.path, key_path(self.path)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# ---------------- CLIENT ----------------
+def connect(path):
+    with open(key_path(path), "rb") as f:
+        authkey = f.read()
+    return Client(path, family="AF_UNIX", authkey=authkey)
+
+
+def ping(path=MODEL_SERVER_SOCKET):
+    """The daemon's {"ops", "models", "batches"}, or None when none answers."""
+    try:
+        with connect(path) as conn:
+            conn.send(("ping", None))
+            if conn.poll(2.0):
+                status, info = conn.recv()
+                return info if status == "ok" else None
+    except Exception:
+        pass
+    return None
+
+
+class ModelServerClient:
+    """
+    Calls into the daemon over one connection per thread. While the daemon
+    is unreachable, calls return None for RETRY_S seconds without trying.
+    """
+
+    def __init__(self, path=MODEL_SERVER_SOCKET, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.ops = None
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    def available(self, op=None):
+        if not self.path or time.monotonic() < self.retry_at or not os.path.exists(self.path):
+            return False
+        if self.ops is None:
+            with self.lock:
+                if self.ops is None:
+                    info = ping(self.path)
+                    if info is None:
+                        self.retry_at = time.monotonic() + RETRY_S
+                        return False
+                    self.ops = info["ops"]
+                    registry.mark_remote(OPS[name] for name in self.ops)
+        return op is None or op in self.ops
+
+    def disconnect(self):
+        conn = getattr(self.local, "conn", None)
+        self.local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, op, payload):
+        """The daemon's result for one request, or None if it is not available (run locally)."""
+        if not self.available(op):
+            return None
+        while True:
+            conn = getattr(self.local, "conn", None)
+            reused = conn is not None
+            try:
+                if conn is None:
+                    conn = self.local.conn = connect(self.path)
+                conn.send((op, payload))
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f"no reply from the model server within {self.timeout:.0f}s")
+                status, value = conn.recv()
+                break
+            except Exception as e:
+                self.disconnect()
+                if reused and not isinstance(e, TimeoutError):
+                    continue    # opened before the daemon restarted; try a fresh one
+                # Daemon gone or stuck: forget it for a while and use local models
+                with self.lock:
+                    self.ops = None
+                    self.retry_at = time.monotonic() + RETRY_S
+                registry.mark_remote(())
+                return None
+
+        if status != "ok":
+            return None    # e.g. a model failed to load there; the local copy may work
+        return value
+
+
+# Singleton instance
+model_client = ModelServerClient()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared model server for Whisper, EasyOCR and the embedder.")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "data/model_server.sock")
+    parser.add_argument("--models", default=",".join(OPS), help=f"Comma-separated subset of {', '.join(OPS)}")
+    parser.add_argument("--batch-ms", type=float, default=BATCH_WINDOW_MS, help="Batching window")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--no-warm-up", action="store_true", help="Load models on first request")
+    args = parser.parse_args()
+
+    ops = [op.strip() for op in args.models.split(",") if op.strip()]
+    unknown = set(ops) - set(OPS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+
+    # Registers the loaders
+    import multimodal.audio_asr  # noqa: F401
+    import multimodal.image_ocr  # noqa: F401
+    import rag.retriever  # noqa: F401
+
+    # Remove the socket on kill too, not just Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = ModelServer(args.socket, ops, args.batch_ms, args.max_batch)
+    try:
+        server.serve(warm_up=not args.no_warm_up)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
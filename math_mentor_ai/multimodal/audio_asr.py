@@ -1,64 +1,266 @@
 import os
 import shutil
+import subprocess
 import tempfile
-import whisper
-import imageio_ffmpeg
-
-# Setup ffmpeg: Ensure 'ffmpeg' (or 'ffmpeg.exe') is available in PATH
-ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
-ffmpeg_dir = os.path.dirname(ffmpeg_exe)
-
-target_name = "ffmpeg.exe" if os.name == 'nt' else "ffmpeg"
-
-if os.path.basename(ffmpeg_exe).lower() != target_name.lower():
-    # Copy to a temp dir with the standard name ("ffmpeg" or "ffmpeg.exe")
-    temp_ffmpeg_dir = os.path.join(tempfile.gettempdir(), "math_mentor_ffmpeg")
-    os.makedirs(temp_ffmpeg_dir, exist_ok=True)
-    target_path = os.path.join(temp_ffmpeg_dir, target_name)
-    
-    # Only copy if missing or size differs
-    if not os.path.exists(target_path) or os.path.getsize(target_path) != os.path.getsize(ffmpeg_exe):
-        shutil.copy(ffmpeg_exe, target_path)
-    
-    # Make sure it's executable on non-Windows
-    if os.name != 'nt':
-        os.chmod(target_path, 0o755)
-
-    os.environ["PATH"] = temp_ffmpeg_dir + os.pathsep + os.environ["PATH"]
-else:
-    # It already has the correct name, just add its dir to PATH
-    os.environ["PATH"] = ffmpeg_dir + os.pathsep + os.environ["PATH"]
-
-model = whisper.load_model("base")
-
-def transcribe_audio(audio_file):
+
+import numpy as np
+
+from model_registry import registry
+from model_server import model_client
+from multimodal.result_cache import asr_cache, content_key, media_bytes
+
+SAMPLE_RATE = 16000          # what Whisper expects
+
+# Energy-based voice activity detection
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DB = -35.0     # frames this far below the loudest one are silence
+VAD_MIN_GAP_S = 0.6          # shorter pauses stay inside a speech segment
+VAD_PAD_S = 0.2              # kept around each segment so word edges are not clipped
+
+STREAM_CHUNK_S = 20          # longest piece transcribed per partial result
+
+# Whisper inference profiles for CPU: model size, fixed language (None
+# auto-detects), beam search or greedy, Whisper's retries at higher
+# temperatures on low-confidence windows, int8 dynamic quantization of the
+# linear layers. "legacy" is the original base-model behaviour and stays the
+# default until python -m benchmarks.bench_asr_profiles shows another profile
+# with no WER regression on real clips.
+ASR_PROFILES = {
+    "legacy": {"model": "base", "language": None, "beam_size": None, "fallback": True, "quantize": False},
+    "fast": {"model": "tiny.en", "language": "en", "beam_size": None, "fallback": False, "quantize": True},
+    "balanced": {"model": "base.en", "language": "en", "beam_size": None, "fallback": False, "quantize": True},
+    "accurate": {"model": "small.en", "language": "en", "beam_size": 5, "fallback": True, "quantize": False},
+}
+ASR_PROFILE = os.environ.get("ASR_PROFILE", "legacy")
+ASR_THREADS = int(os.environ.get("ASR_THREADS", "0"))    # 0: torch default (all cores)
+
+
+def ffmpeg_exe():
+    """The ffmpeg bundled with imageio-ffmpeg, else one on PATH."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def load_whisper(profile=None):
+    import torch
+    import whisper
+
+    settings = ASR_PROFILES[profile or ASR_PROFILE]
+    if ASR_THREADS:
+        torch.set_num_threads(ASR_THREADS)
+
+    model = whisper.load_model(settings["model"], device="cpu")
+
+    if settings["quantize"]:
+        # whisper.model.Linear only differs from nn.Linear by a dtype cast,
+        # which is a no-op on fp32 CPU; quantize_dynamic matches exact types
+        for module in model.modules():
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return model
+
+
+registry.register("whisper", "audio", load_whisper)
+
+
+def whisper_model(profile=None):
+    """The Whisper model of a profile; profiles other than the default load on first use."""
+    if not profile or profile == ASR_PROFILE:
+        return registry.get("whisper")
+
+    name = f"whisper:{profile}"
+    if name not in registry.loaders:
+        registry.register(name, "audio", lambda: load_whisper(profile))
+    return registry.get(name)
+
+
+def transcribe_array(audio, profile=None):
+    """Whisper's text for 16 kHz mono audio, from the shared model server when one is running."""
+    text = model_client.call("transcribe", (audio, profile or ASR_PROFILE))
+    if text is None:
+        text = whisper_model(profile).transcribe(audio, **decode_options(profile)).get("text", "")
+    return text
+
+
+def decode_options(profile=None):
+    """Keyword arguments for model.transcribe() under a profile."""
+    settings = ASR_PROFILES[profile or ASR_PROFILE]
+    options = {"language": settings["language"], "fp16": False}
+    if settings["beam_size"]:
+        options["beam_size"] = settings["beam_size"]
+    if not settings["fallback"]:
+        # Decode once at temperature 0 instead of retrying hotter
+        options["temperature"] = 0.0
+    return options
+
+
+def decode_audio(data, suffix=".wav"):
+    """
+    Decodes any ffmpeg-readable audio to mono 16 kHz float32 PCM, piping the
+    bytes through ffmpeg's stdin/stdout instead of a temp file.
+    """
+    cmd = [
+        ffmpeg_exe(), "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1"
+    ]
+    proc = subprocess.run(cmd, input=data, capture_output=True)
+
+    if proc.returncode != 0 or not proc.stdout:
+        # MP4/M4A files with the index at the end cannot be read from a
+        # pipe; those (rare) uploads still go through a temp file
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            tmp.write(data)
+            temp_path = tmp.name
+        try:
+            cmd[cmd.index("pipe:0")] = temp_path
+            proc = subprocess.run(cmd, capture_output=True)
+        finally:
+            os.remove(temp_path)
+
+        if proc.returncode != 0:
+            raise RuntimeError(f"Could not decode audio: {proc.stderr.decode(errors='ignore').strip()}")
+
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def speech_segments(audio):
     """
-    Converts audio to text using Whisper
+    [(start, end), ...] sample ranges containing speech. Frames are compared
+    to the loudest frame, so the threshold adapts to the recording level.
     """
+    frame = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    voiced = energy_db > max(energy_db.max() + VAD_THRESHOLD_DB, -60.0)
+
+    segments = []
+    max_gap = int(VAD_MIN_GAP_S * 1000 / VAD_FRAME_MS)
+    for i in np.flatnonzero(voiced):
+        if segments and i - segments[-1][1] <= max_gap:
+            segments[-1][1] = i + 1
+        else:
+            segments.append([i, i + 1])
+
+    pad = int(VAD_PAD_S * SAMPLE_RATE)
+    return [
+        (max(0, start * frame - pad), min(len(audio), end * frame + pad))
+        for start, end in segments
+    ]
 
-    suffix = ".wav"
+
+def trim_silence(audio):
+    """Leading, trailing and long inner silences removed."""
+    segments = speech_segments(audio)
+    if not segments:
+        return audio[:0]
+    return np.concatenate([audio[start:end] for start, end in segments])
+
+
+def stream_chunks(audio):
+    """Speech segments packed into pieces of at most STREAM_CHUNK_S seconds."""
+    limit = STREAM_CHUNK_S * SAMPLE_RATE
+    piece = []
+    size = 0
+    for start, end in speech_segments(audio):
+        # A single very long segment is cut at the limit
+        for cut in range(start, end, limit):
+            part = audio[cut:min(end, cut + limit)]
+            if piece and size + len(part) > limit:
+                yield np.concatenate(piece)
+                piece, size = [], 0
+            piece.append(part)
+            size += len(part)
+    if piece:
+        yield np.concatenate(piece)
+
+
+def upload_suffix(audio_file):
     if hasattr(audio_file, "name"):
         _, ext = os.path.splitext(audio_file.name)
         if ext:
-            suffix = ext
+            return ext
+    return ".wav"
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        if isinstance(audio_file, bytes):
-            tmp.write(audio_file)
-        else:
-            tmp.write(audio_file.read())
-        temp_path = tmp.name
 
-    try:
-        result = model.transcribe(temp_path)
+def transcription_result(text):
+    text = text.strip()
+    confidence = 0.9 if len(text) > 5 else 0.4
+    return {
+        "text": text,
+        "confidence": confidence
+    }
+
+
+def cache_namespace(profile):
+    # The same clip transcribes differently under another profile
+    return f"asr:{profile or ASR_PROFILE}"
+
+
+def transcribe_audio(audio_file, profile=None):
+    """
+    Converts audio to text using Whisper. profile picks one of ASR_PROFILES
+    (default: ASR_PROFILE).
+    """
+    data = media_bytes(audio_file)
+    namespace = cache_namespace(profile)
+    key = content_key(data, namespace)
+    cached = asr_cache.get(key, namespace)
+    if cached is not None:
+        return dict(cached)
+
+    audio = trim_silence(decode_audio(data, upload_suffix(audio_file)))
+
+    if len(audio) == 0:
+        result = transcription_result("")
+    else:
+        result = transcription_result(transcribe_array(audio, profile))
+
+    asr_cache.put(key, namespace, result)
+    return result
+
+
+def transcribe_audio_stream(audio_file, profile=None):
+    """
+    Transcribes speech piece by piece, yielding the text so far after each
+    piece: {"text", "confidence", "progress" (0-1), "done"}. The last item
+    is the complete transcription.
+    """
+    data = media_bytes(audio_file)
+    namespace = cache_namespace(profile)
+    key = content_key(data, namespace)
+    cached = asr_cache.get(key, namespace)
+    if cached is not None:
+        yield dict(cached, progress=1.0, done=True)
+        return
+
+    audio = decode_audio(data, upload_suffix(audio_file))
+    chunks = list(stream_chunks(audio))
 
-        text = result.get("text", "").strip()
+    parts = []
+    for i, chunk in enumerate(chunks):
+        text = transcribe_array(chunk, profile).strip()
+        if text:
+            parts.append(text)
+        partial = transcription_result(" ".join(parts))
+        partial["progress"] = (i + 1) / len(chunks)
+        partial["done"] = i + 1 == len(chunks)
+        yield partial
 
-        confidence = 0.9 if len(text) > 5 else 0.4
+    if not chunks:
+        final = transcription_result("")
+        final["progress"] = 1.0
+        final["done"] = True
+        yield final
 
-        return {
-            "text": text,
-            "confidence": confidence
-        }
-    finally:
-        os.remove(temp_path)
+    asr_cache.put(key, namespace, transcription_result(" ".join(parts)))
@@ -1,20 +1,39 @@
-import easyocr
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from PIL import Image
 
-reader = easyocr.Reader(['en'], gpu=False)
+from model_registry import registry
+from model_server import model_client
+from multimodal.image_preprocess import MAX_SKEW_DEG, PREPROCESS_ENABLED, TARGET_TEXT_HEIGHT, preprocess_image
+from multimodal.result_cache import PHASH_DISTANCE, content_key, media_bytes, ocr_cache, perceptual_hash
+
+# Images per EasyOCR readtext_batched call
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", "8"))
 
-def extract_text_from_image(image):
-    """
-    Performs OCR on uploaded image
-    Returns extracted text + confidence score
-    """
 
-    img = Image.open(image).convert("RGB")
-    img_np = np.array(img)
+def load_reader():
+    import easyocr
+    return easyocr.Reader(['en'], gpu=False)
 
-    results = reader.readtext(img_np)
 
+registry.register("ocr", "image", load_reader)
+
+
+def load_for_ocr(image, preprocess=PREPROCESS_ENABLED):
+    if preprocess:
+        # Grayscale, deskewed, cropped to the text and scaled down
+        img_np, _ = preprocess_image(image)
+        return img_np
+
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    return np.array(img.convert("RGB"))
+
+
+def ocr_result(results):
+    """EasyOCR [(bbox, text, conf), ...] -> {"text", "confidence"}"""
     extracted_text = []
     confidences = []
 
@@ -34,3 +53,108 @@ def extract_text_from_image(image):
         "text": " ".join(extracted_text),
         "confidence": round(avg_confidence, 2)
     }
+
+
+def cache_namespace(preprocess):
+    # Results depend on the preprocessing settings as well as the pixels
+    return f"ocr:{preprocess}:{TARGET_TEXT_HEIGHT}:{MAX_SKEW_DEG}" if preprocess else "ocr:raw"
+
+
+def cache_lookup(image, preprocess):
+    """
+    (source, key, phash, cached result) for an upload. The source is a
+    fresh BytesIO, so the caller's file position does not matter; PIL
+    images are not cached (key None).
+    """
+    data = media_bytes(image)
+    if data is None:
+        return image, None, None, None
+
+    namespace = cache_namespace(preprocess)
+    key = content_key(data, namespace)
+    phash = perceptual_hash(data) if PHASH_DISTANCE >= 0 else None
+    return io.BytesIO(data), key, phash, ocr_cache.get(key, namespace, phash)
+
+
+def extract_text_from_image(image, preprocess=PREPROCESS_ENABLED):
+    """
+    Performs OCR on uploaded image
+    Returns extracted text + confidence score
+    """
+    source, key, phash, cached = cache_lookup(image, preprocess)
+    if cached is not None:
+        return dict(cached)
+
+    result = ocr_result(recognize([load_for_ocr(source, preprocess)])[0])
+
+    if key is not None:
+        ocr_cache.put(key, cache_namespace(preprocess), result, phash)
+    return result
+
+
+def pad_to(img, height, width):
+    """Pads with paper-white so differently sized images stack into one batch."""
+    padded = np.full((height, width) + img.shape[2:], 255, dtype=img.dtype)
+    padded[:img.shape[0], :img.shape[1]] = img
+    return padded
+
+
+def readtext_many(reader, arrays, batch_size=OCR_BATCH_SIZE):
+    """
+    EasyOCR results for many image arrays, in input order. Similar sizes
+    share a readtext_batched call, so little of each batch is padding.
+    """
+    if len(arrays) == 1:
+        return [reader.readtext(arrays[0])]
+
+    results = [None] * len(arrays)
+    order = sorted(range(len(arrays)), key=lambda i: arrays[i].shape[:2])
+
+    for start in range(0, len(order), batch_size):
+        group = order[start:start + batch_size]
+        height = max(arrays[i].shape[0] for i in group)
+        width = max(arrays[i].shape[1] for i in group)
+        batch = [pad_to(arrays[i], height, width) for i in group]
+
+        for i, found in zip(group, reader.readtext_batched(batch, batch_size=batch_size)):
+            results[i] = found
+
+    return results
+
+
+def recognize(arrays, batch_size=OCR_BATCH_SIZE):
+    """Raw EasyOCR results per array, from the shared model server when one is running."""
+    found = model_client.call("ocr", arrays)
+    if found is None:
+        found = readtext_many(registry.get("ocr"), arrays, batch_size)
+    return found
+
+
+def extract_text_from_images(images, preprocess=PREPROCESS_ENABLED, batch_size=OCR_BATCH_SIZE):
+    """
+    OCR for many images (paths, file objects or PIL images). Images are
+    preprocessed in parallel threads, then recognised batch_size at a time
+    with EasyOCR's readtext_batched. Returns one {"text", "confidence"} per
+    image, in input order.
+    """
+    images = list(images)
+    if not images:
+        return []
+
+    # PIL and NumPy release the GIL for hashing, decoding, resizing and rotating
+    with ThreadPoolExecutor(min(len(images), os.cpu_count() or 1)) as executor:
+        lookups = list(executor.map(lambda image: cache_lookup(image, preprocess), images))
+        results = [dict(cached) if cached is not None else None for _, _, _, cached in lookups]
+        todo = [i for i, result in enumerate(results) if result is None]
+        arrays = dict(zip(todo, executor.map(lambda i: load_for_ocr(lookups[i][0], preprocess), todo)))
+
+    if not todo:
+        return results
+
+    for i, found in zip(todo, recognize([arrays[i] for i in todo], batch_size)):
+        results[i] = ocr_result(found)
+        _, key, phash, _ = lookups[i]
+        if key is not None:
+            ocr_cache.put(key, cache_namespace(preprocess), results[i], phash)
+
+    return results
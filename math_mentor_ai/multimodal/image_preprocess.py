@@ -0,0 +1,148 @@
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Preprocessing ahead of OCR: grayscale, deskew, crop to the text, and scale
+# so lines of text are about OCR_TARGET_TEXT_HEIGHT pixels tall. Off by default
+# until python -m benchmarks.bench_ocr_preprocess shows a win on real uploads.
+PREPROCESS_ENABLED = os.environ.get("OCR_PREPROCESS", "0") != "0"
+TARGET_TEXT_HEIGHT = int(os.environ.get("OCR_TARGET_TEXT_HEIGHT", "32"))
+MAX_SKEW_DEG = float(os.environ.get("OCR_MAX_SKEW", "10"))
+MAX_SIDE = 2000              # cap when no text lines can be measured
+ANALYSIS_SIDE = 800          # layout analysis runs on a thumbnail about this size
+SKEW_SIDE = 400              # and the skew search on one about half that
+CROP_MARGIN = 0.02           # of the image size, kept around the text box
+MIN_MARGIN = 12              # pixels; the detector misses glyphs touching the edge
+
+
+def load_gray(image):
+    """Upload (path, file object or PIL image) -> upright grayscale PIL image."""
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    # Phone photos are stored sideways with an EXIF rotation tag
+    return ImageOps.exif_transpose(img).convert("L")
+
+
+def otsu_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * np.arange(256))
+    total = weight[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean[-1] * weight - mean * total) ** 2 / (weight * (total - weight))
+    # A uniform image has no split at all
+    return int(np.argmax(np.nan_to_num(between)))
+
+
+def ink_mask(gray):
+    """Dark pixels that are clearly darker than the paper."""
+    threshold = min(otsu_threshold(gray), np.median(gray) - 25)
+    # Otsu's dark class includes the threshold itself; on a pure two-tone
+    # image the threshold is the ink's own value
+    return gray <= threshold
+
+
+def estimate_skew(mask, max_angle=MAX_SKEW_DEG):
+    """
+    Angle (degrees) that makes text lines horizontal: the rotation whose
+    row projection is sharpest, i.e. has the largest variance. Searched in
+    1 degree steps, then refined in 0.25 degree steps.
+    """
+    if max_angle <= 0 or not mask.any():
+        return 0.0
+
+    img = Image.fromarray(mask.astype(np.uint8) * 255)
+    img = img.reduce(max(1, max(img.size) // SKEW_SIDE))
+
+    def sharpness(angle):
+        rotated = np.asarray(img.rotate(angle, resample=Image.NEAREST, expand=True))
+        return np.var(rotated.sum(axis=1, dtype=np.int64))
+
+    best = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=sharpness)
+    best = max(np.arange(best - 0.75, best + 0.8, 0.25), key=sharpness)
+    return round(float(np.clip(best, -max_angle, max_angle)), 2)
+
+
+def text_box(mask):
+    """(left, top, right, bottom) around the ink, ignoring stray specks."""
+    if not mask.any():
+        return None
+
+    ys, xs = np.nonzero(mask)
+    top, bottom = np.percentile(ys, [0.5, 99.5])
+    left, right = np.percentile(xs, [0.5, 99.5])
+    h, w = mask.shape
+    my, mx = max(CROP_MARGIN * h, MIN_MARGIN), max(CROP_MARGIN * w, MIN_MARGIN)
+    return (max(0, int(left - mx)), max(0, int(top - my)),
+            min(w, int(right + mx) + 1), min(h, int(bottom + my) + 1))
+
+
+def text_line_height(mask):
+    """Median height in pixels of the text lines (runs of inked rows), or None."""
+    profile = mask.sum(axis=1)
+    if not profile.any():
+        return None
+
+    inked = profile > 0.1 * profile[profile > 0].mean()
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], inked.astype(np.int8), [0]])))
+    heights = edges[1::2] - edges[0::2]
+    heights = heights[heights >= 2]   # single rows are noise
+    if len(heights) == 0:
+        return None
+    return float(np.median(heights))
+
+
+def preprocess_image(image, target_text_height=TARGET_TEXT_HEIGHT, max_skew=MAX_SKEW_DEG, crop=True):
+    """
+    Returns (uint8 grayscale array for the OCR reader, info). Layout is
+    analysed on a thumbnail; the full-resolution image is only cropped, so
+    the resize and rotation run on the text region alone.
+    """
+    start = time.perf_counter()
+    gray = load_gray(image)
+    original_size = gray.size
+
+    # Box-filter reduction by a whole factor is far cheaper than resize()
+    thumb = gray.reduce(max(1, max(gray.size) // ANALYSIS_SIDE))
+    thumb_scale = thumb.width / gray.width
+    mask = ink_mask(np.asarray(thumb))
+
+    angle = estimate_skew(mask, max_skew)
+    level_mask = ink_mask(np.asarray(thumb.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255))) \
+        if angle else mask
+
+    # Scale so text lines come out target_text_height tall; never upscale
+    line_height = text_line_height(level_mask)
+    if line_height:
+        scale = min(1.0, target_text_height / (line_height / thumb_scale))
+    else:
+        scale = min(1.0, MAX_SIDE / max(gray.size))
+
+    box = text_box(mask) if crop else None
+    if box:
+        box = tuple(min(limit, round(v / thumb_scale)) for v, limit in zip(box, gray.size * 2))
+        gray = gray.crop(box)
+
+    if scale < 1:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.LANCZOS, reducing_gap=3.0)
+
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+        if crop:
+            # Trim the corners the rotation brought in
+            level_box = text_box(ink_mask(np.asarray(gray)))
+            if level_box:
+                gray = gray.crop(level_box)
+
+    info = {
+        "original_size": original_size,
+        "size": gray.size,
+        "scale": round(scale, 3),
+        "skew_deg": angle,
+        "crop_box": box,
+        "line_height_px": round(line_height / thumb_scale, 1) if line_height else None,
+        "ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+    return np.asarray(gray), info
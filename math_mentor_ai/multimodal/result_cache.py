@@ -0,0 +1,239 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+MEDIA_CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR", "data/media_cache")   # empty: memory only
+MEDIA_CACHE_MB = float(os.environ.get("MEDIA_CACHE_MB", "64"))           # disk budget per cache
+# Max differing bits (of 256) for two images to count as the same upload.
+# Re-encoded or resized copies land within a few bits, but so does a
+# worksheet with one digit changed ("2x + 3" vs "5x + 3" differ by 1 bit),
+# so near-duplicate matching is opt-in. -1 disables it.
+PHASH_DISTANCE = int(os.environ.get("OCR_PHASH_DISTANCE", "-1"))
+PHASH_SIZE = 16
+PHASH_ANALYSIS_SIDE = 512
+PHASH_MIN_BITS = 24          # near-blank images are only matched exactly
+
+
+def media_bytes(source):
+    """Raw bytes of an upload (bytes, path, Streamlit UploadedFile or file object); None for PIL images."""
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if hasattr(source, "read"):
+        data = source.read()
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return data
+    return None
+
+
+def content_key(data, namespace):
+    """Content address of an upload under the settings that produced its result."""
+    return hashlib.sha256(namespace.encode("utf-8") + b"\0" + data).hexdigest()
+
+
+def namespace_id(namespace):
+    return hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:8]
+
+
+def perceptual_hash(data):
+    """
+    256-bit difference hash (dHash) of the text region of an image:
+    brightness gradients of a 17x16 thumbnail of the inked area, stable
+    under re-encoding and resizing. Hashing the whole frame would make two
+    worksheets that are mostly blank paper look alike. None if the bytes
+    are not an image or the image has too little structure to tell apart.
+    """
+    from PIL import Image, ImageOps
+
+    from multimodal.image_preprocess import ink_mask, text_box
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEG can decode straight at a fraction of the size
+        img.draft("L", (PHASH_ANALYSIS_SIDE, PHASH_ANALYSIS_SIDE))
+        gray = ImageOps.exif_transpose(img).convert("L")
+    except Exception:
+        return None
+
+    gray = gray.reduce(max(1, max(gray.size) // PHASH_ANALYSIS_SIDE))
+    box = text_box(ink_mask(np.asarray(gray)))
+    if box:
+        gray = gray.crop(box)
+    pixels = np.asarray(gray.resize((PHASH_SIZE + 1, PHASH_SIZE), Image.BILINEAR), dtype=np.int16)
+
+    gradient = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    if gradient.sum() < PHASH_MIN_BITS:
+        return None
+    return int("".join("1" if bit else "0" for bit in gradient), 2)
+
+
+class MediaCache:
+    """
+    Content-addressed cache of OCR / ASR results. A bounded in-memory LRU
+    sits in front of an on-disk tier (one JSON file per entry, oldest files
+    evicted past max_bytes), so repeat uploads skip the model even after a
+    restart. Entries can carry a perceptual hash for near-duplicate images.
+    """
+
+    def __init__(self, name, maxsize=256, directory=None, max_bytes=int(MEDIA_CACHE_MB * 1024 * 1024)):
+        self.name = name
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()      # key -> result
+        self.phashes = {}                 # key -> (namespace id, phash)
+        self.disk = None                  # key -> (file name, bytes, namespace id, phash); read lazily
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    # ---- disk tier ----
+    def disk_index(self):
+        if self.disk is not None:
+            return self.disk
+
+        self.disk = OrderedDict()
+        if self.directory and os.path.isdir(self.directory):
+            files = [f for f in os.listdir(self.directory) if f.endswith(".json")]
+            paths = {f: os.path.join(self.directory, f) for f in files}
+            # Oldest first, so eviction pops from the front
+            for file in sorted(files, key=lambda f: os.path.getmtime(paths[f])):
+                parts = file[:-len(".json")].split(".")
+                if len(parts) != 3:
+                    continue
+                key, ns, phash = parts
+                self.disk[key] = (file, os.path.getsize(paths[file]), ns, int(phash, 16) if phash != "-" else None)
+        return self.disk
+
+    def read_disk(self, key):
+        file = self.disk_index()[key][0]
+        path = os.path.join(self.directory, file)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.disk.pop(key, None)
+            return None
+        os.utime(path)
+        self.disk.move_to_end(key)
+        return value
+
+    def write_disk(self, key, ns, phash, value):
+        os.makedirs(self.directory, exist_ok=True)
+        file = f"{key}.{ns}.{phash:064x}.json" if phash is not None else f"{key}.{ns}.-.json"
+        path = os.path.join(self.directory, file)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+        disk = self.disk_index()
+        disk[key] = (file, os.path.getsize(path), ns, phash)
+        disk.move_to_end(key)
+
+        total = sum(size for _, size, _, _ in disk.values())
+        while total > self.max_bytes and len(disk) > 1:
+            _, (old_file, size, _, _) = disk.popitem(last=False)
+            total -= size
+            try:
+                os.remove(os.path.join(self.directory, old_file))
+            except OSError:
+                pass
+
+    # ---- lookups ----
+    def remember(self, key, value, ns=None, phash=None):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if phash is not None:
+            self.phashes[key] = (ns, phash)
+        if len(self.entries) > self.maxsize:
+            old_key, _ = self.entries.popitem(last=False)
+            self.phashes.pop(old_key, None)
+
+    def nearest(self, ns, phash):
+        """Key of a cached image within PHASH_DISTANCE bits, memory first."""
+        candidates = list(self.phashes.items())
+        if self.directory:
+            candidates += [(key, (n, p)) for key, (_, _, n, p) in self.disk_index().items() if p is not None]
+        best_key, best_distance = None, PHASH_DISTANCE + 1
+        for key, (n, other) in candidates:
+            if n == ns:
+                distance = (phash ^ other).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+        return best_key
+
+    def lookup(self, key):
+        """(value, tier) from memory, then disk; (None, None) if absent."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key], "memory"
+
+        if self.directory and key in self.disk_index():
+            value = self.read_disk(key)
+            if value is not None:
+                _, _, ns, phash = self.disk[key]
+                self.remember(key, value, ns, phash)
+                return value, "disk"
+
+        return None, None
+
+    def get(self, key, namespace, phash=None):
+        """Cached result for a content key, else for a near-identical image, else None."""
+        with self.lock:
+            value, tier = self.lookup(key)
+
+            if value is None and phash is not None and PHASH_DISTANCE >= 0:
+                near = self.nearest(namespace_id(namespace), phash)
+                if near is not None:
+                    value, _ = self.lookup(near)
+                    tier = "perceptual"
+
+            self.counts[f"{tier}_hits" if value is not None else "misses"] += 1
+            return value
+
+    def put(self, key, namespace, value, phash=None):
+        ns = namespace_id(namespace)
+        with self.lock:
+            self.remember(key, value, ns, phash)
+            if self.directory:
+                self.write_disk(key, ns, phash, value)
+
+    def stats(self):
+        tiers = {f"{tier}_hits": self.counts[f"{tier}_hits"] for tier in ("memory", "disk", "perceptual")}
+        hits = sum(tiers.values())
+        lookups = hits + self.counts["misses"]
+        disk = self.disk_index() if self.directory else {}
+        return {
+            "size": len(self.entries),
+            "disk_entries": len(disk),
+            "disk_mb": round(sum(size for _, size, _, _ in disk.values()) / (1024 * 1024), 2),
+            "hits": hits,
+            **tiers,
+            "misses": self.counts["misses"],
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.phashes.clear()
+            self.counts.clear()
+
+
+def cache_dir(name):
+    return os.path.join(MEDIA_CACHE_DIR, name) if MEDIA_CACHE_DIR else None
+
+
+# Singleton instances
+ocr_cache = MediaCache("ocr", directory=cache_dir("ocr"))
+asr_cache = MediaCache("asr", directory=cache_dir("asr"))
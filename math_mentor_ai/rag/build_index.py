@@ -1,13 +1,31 @@
+import argparse
+import hashlib
+import json
 import os
 import re
-import pickle
-import faiss
-from sentence_transformers import SentenceTransformer
 
-KB_PATH = "rag/knowledge_base"
-INDEX_PATH = "rag/index"
+import numpy as np
 
-os.makedirs(INDEX_PATH, exist_ok=True)
+from rag.chunk_store import CHUNK_IDS_FILE, replace_file, write_chunk_store
+from rag.lexical import BM25Index, BM25_FILE, LEGACY_BM25_FILE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KB_PATH = os.path.join(BASE_DIR, "knowledge_base")
+INDEX_PATH = os.path.join(BASE_DIR, "index")
+SHARD_PATH = os.path.join(INDEX_PATH, "shards")
+MANIFEST_FILE = "manifest.json"
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# "flat" (exact), "fp16" / "pq" (flat scan over float16 / product-quantized
+# vectors), "ivf" or "hnsw"; the retriever's nprobe / efSearch apply at query time
+INDEX_TYPE = os.environ.get("RAG_INDEX_TYPE", "flat")
+INDEX_TYPES = ["flat", "fp16", "pq", "ivf", "hnsw"]
+IVF_NLIST = int(os.environ.get("RAG_IVF_NLIST", "0"))    # 0: about 4 * sqrt(chunks)
+HNSW_M = int(os.environ.get("RAG_HNSW_M", "32"))
+PQ_M = int(os.environ.get("RAG_PQ_M", "48"))             # sub-quantizers; must divide the dimension
+
+os.makedirs(SHARD_PATH, exist_ok=True)
 
 
 # ---------------- CHUNKING ----------------
@@ -32,38 +50,263 @@ def chunk_text(text, max_length=500):
     return chunks
 
 
+def chunk_id(source, text):
+    """
+    Stable 63-bit FAISS id from the chunk's content hash: an unchanged chunk
+    keeps its id (and its vector) across rebuilds.
+    """
+    digest = hashlib.sha256(f"{source}\n{text}".encode("utf-8")).hexdigest()
+    return int(digest[:15], 16)
+
+
 # ---------------- LOAD FILES ----------------
 def load_and_chunk_docs():
-    all_chunks = []
+    """Returns {chunk_id: {"source": file, "text": chunk}} for the whole KB."""
+    all_chunks = {}
 
-    for file in os.listdir(KB_PATH):
+    for file in sorted(os.listdir(KB_PATH)):
         if file.endswith(".md"):
             with open(os.path.join(KB_PATH, file), "r", encoding="utf-8") as f:
                 text = f.read()
-                chunks = chunk_text(text)
-                all_chunks.extend(chunks)
+                for chunk in chunk_text(text):
+                    all_chunks[chunk_id(file, chunk)] = {"source": file, "text": chunk}
 
     return all_chunks
 
 
+def topic_of(source):
+    """One KB file per topic: "linear_algebra.md" -> "linear_algebra"."""
+    return os.path.splitext(source)[0]
+
+
+def shard_files(topic):
+    return (os.path.join(SHARD_PATH, f"{topic}.index"),
+            os.path.join(SHARD_PATH, f"{topic}.{BM25_FILE}"))
+
+
+# ---------------- MANIFEST ----------------
+def load_manifest():
+    path = os.path.join(INDEX_PATH, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(chunks, index_config):
+    manifest = {
+        "model": EMBEDDING_MODEL,
+        "index": index_config,
+        "shards": sorted({topic_of(c["source"]) for c in chunks.values()}),
+        "chunks": {str(cid): {"source": c["source"]} for cid, c in chunks.items()}
+    }
+    with open(os.path.join(INDEX_PATH, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+# ---------------- INDEX TYPES ----------------
+def make_index(index_type, dim, n_vectors, nlist=IVF_NLIST, hnsw_m=HNSW_M):
+    """
+    Empty ID-mapped index of the requested type. IVF still has to be trained
+    (see train_index) before vectors are added.
+    """
+    import faiss
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    if index_type == "pq" and n_vectors >= 256:
+        m = max(d for d in range(1, min(PQ_M, dim) + 1) if dim % d == 0)
+        return faiss.IndexIDMap2(faiss.IndexPQ(dim, m, 8))
+
+    if index_type in ("fp16", "pq"):
+        # PQ trains 256 centroids per sub-quantizer; smaller indexes (and
+        # small topic shards) keep float16 vectors instead
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16))
+
+    if index_type == "ivf":
+        nlist = nlist or max(1, int(4 * np.sqrt(n_vectors)))
+        # k-means needs at least one training point per list
+        nlist = max(1, min(nlist, n_vectors))
+        quantizer = faiss.IndexFlatL2(dim)
+        # IVF stores ids itself and supports remove_ids without a wrapper
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+
+    if index_type == "hnsw":
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dim, hnsw_m))
+
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def train_index(index, embeddings):
+    if not index.is_trained:
+        index.train(embeddings)
+
+
+def supports_removal(index_type):
+    # HNSW graphs cannot delete nodes; they are rebuilt from stored vectors
+    return index_type != "hnsw"
+
+
+def reconstruct_vectors(index, ids):
+    return np.vstack([index.reconstruct(int(i)) for i in ids]).astype("float32")
+
+
+def build_lexical_index(chunks, path=os.path.join(INDEX_PATH, BM25_FILE)):
+    """BM25 over the same chunk ids; no embeddings, so always rebuilt in full."""
+    replace_file(path, BM25Index.build({cid: c["text"] for cid, c in chunks.items()}).save)
+
+    legacy = path[:-len(BM25_FILE)] + LEGACY_BM25_FILE
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+def write_index(index, path):
+    import faiss
+
+    # Never rewrite an index in place: the retriever memory-maps it
+    replace_file(path, lambda tmp_path: faiss.write_index(index, tmp_path))
+
+
+def update_index(index, index_type, kept, added, removed, vectors, nlist=IVF_NLIST, hnsw_m=HNSW_M):
+    """
+    Applies one change set to an ID-mapped index (None starts a new one).
+    vectors maps each added chunk id to its embedding; kept chunks are only
+    needed when the index type cannot remove ids and has to be rebuilt.
+    Returns the updated index, or None if nothing is left in it.
+    """
+    embeddings = np.vstack([vectors[cid] for cid in added]) if added else None
+    ids = list(added)
+
+    if removed and not supports_removal(index_type):
+        # Rebuild from the kept vectors (no re-embedding) plus the new ones
+        if kept:
+            kept_vectors = reconstruct_vectors(index, kept)
+            embeddings = kept_vectors if embeddings is None else np.vstack([kept_vectors, embeddings])
+            ids = kept + ids
+        index = None
+    elif removed:
+        index.remove_ids(np.array(removed, dtype="int64"))
+
+    if embeddings is not None:
+        if index is None:
+            index = make_index(index_type, embeddings.shape[1], len(embeddings), nlist, hnsw_m)
+            train_index(index, embeddings)
+        index.add_with_ids(embeddings, np.array(ids, dtype="int64"))
+
+    if index is not None and index.ntotal == 0:
+        return None
+    return index
+
+
 # ---------------- BUILD INDEX ----------------
-def build_faiss_index():
+def build_faiss_index(full=False, index_type=INDEX_TYPE, nlist=IVF_NLIST, hnsw_m=HNSW_M):
+    """
+    Incremental build: only chunks whose content hash is new are embedded,
+    chunks that disappeared are removed from the ID-mapped index, and an
+    unchanged knowledge base is a no-op. full=True re-embeds everything.
+
+    Besides the global index, every KB file gets its own shard (FAISS index
+    plus BM25) under index/shards/, so a query with a known topic only
+    searches that topic's chunks.
+    """
+    import faiss
+
     chunks = load_and_chunk_docs()
+    index_file = os.path.join(INDEX_PATH, "math.index")
+    topics = {cid: topic_of(c["source"]) for cid, c in chunks.items()}
+
+    index_config = {"type": index_type, "nlist": nlist, "hnsw_m": hnsw_m}
+
+    manifest = load_manifest()
+    if (manifest is None or manifest.get("model") != EMBEDDING_MODEL
+            or manifest.get("index", {"type": "flat"}).get("type") != index_type
+            or not os.path.exists(index_file)):
+        full = True
+    elif "shards" not in manifest or any(not os.path.exists(shard_files(t)[0]) for t in manifest["shards"]):
+        # Indexes from before sharding (or with a lost shard) are rebuilt once
+        full = True
+
+    if full:
+        index = None
+        previous = {}
+        for file in os.listdir(SHARD_PATH):
+            os.remove(os.path.join(SHARD_PATH, file))
+    else:
+        index = faiss.read_index(index_file)
+        previous = {int(cid): topic_of(c["source"]) for cid, c in manifest["chunks"].items()}
+
+    added = [cid for cid in chunks if cid not in previous]
+    removed = [cid for cid in previous if cid not in chunks]
+
+    if not added and not removed:
+        if not os.path.exists(os.path.join(INDEX_PATH, BM25_FILE)):
+            build_lexical_index(chunks)
+        if not os.path.exists(os.path.join(INDEX_PATH, CHUNK_IDS_FILE)):
+            # Index built with the old chunks.pkl store
+            write_chunk_store(INDEX_PATH, {cid: c["text"] for cid, c in chunks.items()})
+        print(f"✅ Index up to date ({len(chunks)} chunks)")
+        return
+
+    vectors = {}
+    if added:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(EMBEDDING_MODEL)
+        embeddings = model.encode([chunks[cid]["text"] for cid in added], show_progress_bar=True)
+        vectors = dict(zip(added, np.asarray(embeddings, dtype="float32")))
 
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(chunks, show_progress_bar=True)
+    kept = [cid for cid in chunks if cid in previous]
+    index = update_index(index, index_type, kept, added, removed, vectors, nlist, hnsw_m)
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    if index is None:
+        print("⚠️ Knowledge base is empty, nothing to index")
+        return
 
-    faiss.write_index(index, f"{INDEX_PATH}/math.index")
+    write_index(index, index_file)
 
-    with open(f"{INDEX_PATH}/chunks.pkl", "wb") as f:
-        pickle.dump(chunks, f)
+    # The index returns chunk ids, so the chunk store maps id -> text
+    write_chunk_store(INDEX_PATH, {cid: c["text"] for cid, c in chunks.items()})
 
-    print(f"✅ Indexed {len(chunks)} chunks successfully")
+    build_lexical_index(chunks)
+
+    # ---- Topic shards: only the shards touched by this change set ----
+    touched = {topics[cid] for cid in added} | {previous[cid] for cid in removed}
+    for topic in sorted(touched):
+        shard_index_file, shard_bm25_file = shard_files(topic)
+        topic_chunks = {cid: c for cid, c in chunks.items() if topics[cid] == topic}
+        shard = faiss.read_index(shard_index_file) if os.path.exists(shard_index_file) else None
+
+        shard = update_index(
+            shard, index_type,
+            [cid for cid in kept if topics[cid] == topic],
+            [cid for cid in added if topics[cid] == topic],
+            [cid for cid in removed if previous[cid] == topic],
+            vectors, nlist, hnsw_m
+        )
+
+        if shard is None:
+            for path in shard_files(topic):
+                if os.path.exists(path):
+                    os.remove(path)
+            continue
+
+        write_index(shard, shard_index_file)
+        build_lexical_index(topic_chunks, shard_bm25_file)
+
+    save_manifest(chunks, index_config)
+
+    print(f"✅ Indexed {len(chunks)} chunks successfully into a {index_type} index ({len(added)} embedded, {len(removed)} removed)")
+    print(f"   Topic shards: {', '.join(sorted(set(topics.values())))}")
 
 
 if __name__ == "__main__":
-    build_faiss_index()
+    # Run from the project root: python -m rag.build_index
+    parser = argparse.ArgumentParser(description="Build the RAG index from rag/knowledge_base.")
+    parser.add_argument("--full", action="store_true", help="Re-embed every chunk instead of only changed ones")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--nlist", type=int, default=IVF_NLIST, help="IVF lists (0: about 4 * sqrt(chunks))")
+    parser.add_argument("--hnsw-m", type=int, default=HNSW_M, help="HNSW neighbours per node")
+    args = parser.parse_args()
+
+    build_faiss_index(full=args.full, index_type=args.index_type, nlist=args.nlist, hnsw_m=args.hnsw_m)
@@ -0,0 +1,97 @@
+import mmap
+import os
+import pickle
+
+import numpy as np
+
+CHUNK_TEXT_FILE = "chunks.bin"          # UTF-8 chunk texts, back to back
+CHUNK_IDS_FILE = "chunk_ids.npy"        # sorted int64 chunk ids
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"  # int64 byte offsets, one more than ids
+LEGACY_CHUNK_FILE = "chunks.pkl"
+
+
+def replace_file(path, write):
+    """
+    Writes through a temporary file and renames it into place, so processes
+    that have the old file memory-mapped keep reading a consistent copy.
+    """
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_chunk_store(path, chunks):
+    """chunks: {chunk_id: text}. Stored sorted by id for binary search."""
+    ids = np.array(sorted(chunks), dtype="int64")
+    encoded = [chunks[int(cid)].encode("utf-8") for cid in ids]
+    offsets = np.zeros(len(ids) + 1, dtype="int64")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    def write_text(tmp_path):
+        with open(tmp_path, "wb") as f:
+            for b in encoded:
+                f.write(b)
+
+    def write_array(array):
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+        return write
+
+    # Text first: readers look entries up through ids/offsets
+    replace_file(os.path.join(path, CHUNK_TEXT_FILE), write_text)
+    replace_file(os.path.join(path, CHUNK_OFFSETS_FILE), write_array(offsets))
+    replace_file(os.path.join(path, CHUNK_IDS_FILE), write_array(ids))
+
+    legacy = os.path.join(path, LEGACY_CHUNK_FILE)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+class ChunkStore:
+    """
+    Read-only chunk_id -> text mapping over memory-mapped files. Nothing is
+    parsed at open time, and the pages are shared by every process that
+    opens the same store, so per-process memory does not grow with the KB.
+    """
+
+    def __init__(self, path):
+        self.ids = np.load(os.path.join(path, CHUNK_IDS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        self.text = b""
+        with open(os.path.join(path, CHUNK_TEXT_FILE), "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def position(self, cid):
+        pos = int(np.searchsorted(self.ids, cid))
+        if pos == len(self.ids) or self.ids[pos] != cid:
+            return None
+        return pos
+
+    def __getitem__(self, cid):
+        pos = self.position(cid)
+        if pos is None:
+            raise KeyError(cid)
+        return self.text[self.offsets[pos]:self.offsets[pos + 1]].decode("utf-8")
+
+    def get(self, cid, default=None):
+        try:
+            return self[cid]
+        except KeyError:
+            return default
+
+    def __contains__(self, cid):
+        return self.position(cid) is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def open_chunk_store(path):
+    """The mmap store, or the chunks.pkl of an index built before it existed."""
+    if os.path.exists(os.path.join(path, CHUNK_IDS_FILE)):
+        return ChunkStore(path)
+
+    with open(os.path.join(path, LEGACY_CHUNK_FILE), "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+BM25_FILE = "bm25.bin"
+LEGACY_BM25_FILE = "bm25.json"      # indexes built before the binary format
+MAGIC = b"BM25IDX1"
+
+# Words that carry no topic signal in math questions
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "and", "or", "is", "are",
+    "what", "how", "find", "solve", "calculate", "compute", "value", "with", "by"
+}
+
+# Words, numbers and single math symbols: "d/dx sin x" -> d / dx sin x
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+(?:\.\d+)?|[^\sa-z\d]")
+
+# Array name -> dtype, in file order
+ARRAYS = {
+    "terms": "<i8",      # sorted term hashes
+    "idf": "<f8",        # per term
+    "starts": "<i8",     # per term, where its postings start (one more than terms)
+    "doc_ids": "<i8",    # per posting: chunk id
+    "tfs": "<f8",        # per posting: term frequency
+    "norms": "<f8",      # per posting: k1 * (1 - b + b * doc length / average length)
+}
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def term_hash(term):
+    """Stable 64-bit id of a term (Python's hash() differs between processes)."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class BM25Index:
+    """
+    Inverted index over chunk ids with Okapi BM25 scoring, held in flat
+    arrays: a sorted table of term hashes with each term's idf and posting
+    range, and per posting the chunk id, term frequency and precomputed
+    length normalization. load() memory-maps the file, so, as with the
+    chunk store, nothing is parsed at open time and every process shares
+    the pages. Cheap enough to rebuild from scratch whenever the knowledge
+    base changes.
+    """
+
+    def __init__(self, arrays, k1=1.5, b=0.75, buffer=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.k1 = k1
+        self.b = b
+        self.buffer = buffer    # the mmap the arrays view, if loaded from a file
+
+    @classmethod
+    def from_postings(cls, postings, doc_lengths, k1=1.5, b=0.75):
+        """postings: {term: [[chunk_id, tf], ...]}, doc_lengths: {chunk_id: tokens}"""
+        n = len(doc_lengths)
+        # An empty KB (or one whose chunks have no tokens) has nothing to normalize
+        avg_length = (sum(doc_lengths.values()) / n if n else 0.0) or 1.0
+        by_hash = sorted((term_hash(term), docs) for term, docs in postings.items())
+
+        starts = np.zeros(len(by_hash) + 1, dtype="int64")
+        np.cumsum([len(docs) for _, docs in by_hash], out=starts[1:])
+        df = np.diff(starts).astype("float64")
+        doc_ids = np.array([cid for _, docs in by_hash for cid, _ in docs], dtype="int64")
+        lengths = np.array([doc_lengths[int(cid)] for cid in doc_ids], dtype="float64")
+
+        return cls({
+            "terms": np.array([h for h, _ in by_hash], dtype="int64"),
+            "idf": np.log(1 + (n - df + 0.5) / (df + 0.5)),
+            "starts": starts,
+            "doc_ids": doc_ids,
+            "tfs": np.array([tf for _, docs in by_hash for _, tf in docs], dtype="float64"),
+            "norms": k1 * (1 - b + b * lengths / avg_length),
+        }, k1, b)
+
+    @classmethod
+    def build(cls, chunks):
+        """chunks: {chunk_id: text}"""
+        postings = defaultdict(list)
+        doc_lengths = {}
+        for cid, text in chunks.items():
+            tokens = tokenize(text)
+            doc_lengths[cid] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term].append([cid, tf])
+        return cls.from_postings(postings, doc_lengths)
+
+    def lookup(self, term):
+        h = term_hash(term)
+        pos = int(np.searchsorted(self.terms, h))
+        if pos == len(self.terms) or self.terms[pos] != h:
+            return None
+        return pos
+
+    def search(self, query, top_k=3):
+        """Returns [(chunk_id, score), ...] best first; only chunks sharing a term."""
+        ids, scores = [], []
+        for term in set(tokenize(query)):
+            pos = self.lookup(term)
+            if pos is None:
+                continue
+            lo, hi = self.starts[pos], self.starts[pos + 1]
+            tf = self.tfs[lo:hi]
+            ids.append(self.doc_ids[lo:hi])
+            scores.append(self.idf[pos] * tf * (self.k1 + 1) / (tf + self.norms[lo:hi]))
+        if not ids:
+            return []
+
+        chunk_ids, first, inverse = np.unique(np.concatenate(ids), return_index=True, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        # Best first; ties keep the order chunks were first matched in
+        order = np.lexsort((first, -totals))[:top_k]
+        return [(int(chunk_ids[i]), float(totals[i])) for i in order]
+
+    def save(self, path):
+        """One file: MAGIC, header length, JSON header, then the arrays 8-byte aligned."""
+        layout, offset = [], 0
+        for name, dtype in ARRAYS.items():
+            array = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            layout.append([name, offset, len(array)])
+            offset += array.nbytes
+        header = json.dumps({"k1": self.k1, "b": self.b, "arrays": layout}).encode("utf-8")
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+
+        with open(path, "wb") as f:
+            f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+            for name, dtype in ARRAYS.items():
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a BM25 index")
+        header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], "little")
+        data_start = len(MAGIC) + 8 + header_length
+        header = json.loads(buffer[len(MAGIC) + 8:data_start])
+
+        arrays = {
+            name: np.frombuffer(buffer, dtype=ARRAYS[name], count=count, offset=data_start + offset)
+            for name, offset, count in header["arrays"]
+        }
+        return cls(arrays, header["k1"], header["b"], buffer)
+
+    @classmethod
+    def load_json(cls, path):
+        """An index saved as bm25.json by an older build."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.from_postings(
+            data["postings"],
+            {int(cid): n for cid, n in data["doc_lengths"].items()},
+            data["k1"],
+            data["b"]
+        )
+
+
+def open_bm25(path):
+    """The index at path (a bm25.bin), or the bm25.json next to it from an older build; None if neither."""
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    legacy = path[:-len(BM25_FILE)] + LEGACY_BM25_FILE
+    if os.path.exists(legacy):
+        return BM25Index.load_json(legacy)
+    return None
@@ -1,23 +1,278 @@
-import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
-
 import os
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+
+from model_registry import registry
+from model_server import model_client
+from rag.chunk_store import open_chunk_store
+from rag.lexical import BM25_FILE, open_bm25
+from tracing import tracer
 
 # Get directory of the current file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INDEX_PATH = os.path.join(BASE_DIR, "index")
+SHARD_PATH = os.path.join(INDEX_PATH, "shards")
+MANIFEST_FILE = "manifest.json"    # written last by rag.build_index
+
+# Streamlit reruns retrieve the same problem text over and over
+QUERY_CACHE_SIZE = 512
+
+# Query-time knobs for approximate indexes (see rag/build_index.py --index-type)
+NPROBE = int(os.environ.get("RAG_NPROBE", "8"))
+EF_SEARCH = int(os.environ.get("RAG_EF_SEARCH", "64"))
+
+# "hybrid" fuses BM25 and dense rankings, answering confidently lexical
+# queries from BM25 alone; "dense" and "lexical" use one side only
+RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL_MODE", "hybrid")
+LEXICAL_MIN_SCORE = float(os.environ.get("RAG_LEXICAL_MIN_SCORE", "3.0"))
+LEXICAL_MARGIN = float(os.environ.get("RAG_LEXICAL_MARGIN", "1.5"))
+CANDIDATE_FACTOR = 4   # each side ranks top_k * 4 candidates for fusion
+RRF_K = 60
+
+# Search only the shard of the parser's topic when one was built for it
+TOPIC_SHARDS = os.environ.get("RAG_TOPIC_SHARDS", "1") != "0"
+# Parser topics searched in another topic's shard (there is no linear_equation.md)
+SHARD_ALIASES = {"linear_equation": "algebra"}
+
+
+def load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+
+def read_index(path):
+    """
+    Memory-maps the index file instead of copying it onto the heap, so every
+    worker process shares the same page-cache pages.
+    """
+    import faiss
+
+    # IO_FLAG_MMAP_IFC (faiss >= 1.8) also maps flat / fp16 / PQ codes
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        index = faiss.read_index(path, flags)
+    except RuntimeError:
+        index = faiss.read_index(path)
+    configure_search(index)
+    return index
+
+
+def load_index():
+    index = read_index(os.path.join(INDEX_PATH, "math.index"))
+    return index, open_chunk_store(INDEX_PATH)
+
+
+def index_version():
+    """Changes whenever rag.build_index rewrites the index, so memoized retrievals are not reused."""
+    for name in (MANIFEST_FILE, "math.index"):
+        try:
+            return f"{os.stat(os.path.join(INDEX_PATH, name)).st_mtime_ns:x}"
+        except OSError:
+            continue
+    return "none"
+
+
+def configure_search(index):
+    """Sets nprobe (IVF) / efSearch (HNSW); a flat index has neither."""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", NPROBE), ("efSearch", EF_SEARCH)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not a parameter of this index type
+
+
+def load_lexical():
+    # Indexes built before the BM25 side existed are dense-only
+    return open_bm25(os.path.join(INDEX_PATH, BM25_FILE))
+
+
+def load_shards():
+    """topic -> (FAISS index, BM25 index or None) for every shard on disk."""
+    shards = {}
+    if not os.path.isdir(SHARD_PATH):
+        return shards
+
+    for file in sorted(os.listdir(SHARD_PATH)):
+        if not file.endswith(".index"):
+            continue
+        topic = file[:-len(".index")]
+        index = read_index(os.path.join(SHARD_PATH, file))
+        shards[topic] = (index, open_bm25(os.path.join(SHARD_PATH, f"{topic}.{BM25_FILE}")))
+
+    return shards
+
+
+registry.register("embedder", "rag", load_embedder)
+registry.register("rag_index", "rag", load_index)
+registry.register("bm25", "rag", load_lexical)
+registry.register("rag_shards", "rag", load_shards)
+
+
+class QueryCache:
+    """Small thread-safe LRU for query embeddings and retrieval results."""
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+embedding_cache = QueryCache()
+result_cache = QueryCache()
+
+# How queries were answered: "lexical_only" ones never ran the embedder
+retrieval_stats = Counter()
+
+
+def normalize_query(query):
+    # MiniLM's tokenizer is uncased and ignores spacing, so this does not
+    # change the embedding
+    return " ".join((query or "").lower().split())
+
+
+def embed_queries(queries):
+    """Embeds normalized queries, encoding only the ones not cached, in one call."""
+    vectors = [embedding_cache.get(q) for q in queries]
+    missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+
+    if missing:
+        with tracer.span("rag.embed", queries=len(missing)) as span:
+            # The shared model server batches these with other processes' queries
+            encoded = model_client.call("embed", missing)
+            span.set_attribute("remote", encoded is not None)
+            if encoded is None:
+                encoded = np.asarray(registry.get("embedder").encode(missing), dtype="float32")
+        fresh = dict(zip(missing, encoded))
+        for q, vector in fresh.items():
+            embedding_cache.put(q, vector)
+        vectors = [v if v is not None else fresh[q] for q, v in zip(queries, vectors)]
+
+    return np.vstack(vectors)
+
+
+def lexical_is_confident(hits, top_k):
+    """BM25 alone is trusted when the best chunk scores high and clearly wins."""
+    if len(hits) < top_k:
+        return False
+    runner_up = hits[1][1] if len(hits) > 1 else 0.0
+    return hits[0][1] >= LEXICAL_MIN_SCORE and hits[0][1] >= LEXICAL_MARGIN * runner_up
+
+
+def fuse_rankings(dense_ids, lexical_hits, top_k):
+    """Reciprocal rank fusion of the dense and lexical rankings."""
+    scores = defaultdict(float)
+    for rank, cid in enumerate(dense_ids):
+        scores[cid] += 1.0 / (RRF_K + rank + 1)
+    for rank, (cid, _) in enumerate(lexical_hits):
+        scores[cid] += 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=lambda cid: -scores[cid])[:top_k]
+
+
+def rank_queries(keys, index, bm25, top_k, mode):
+    """
+    Chunk ids for each normalized query. BM25 runs first; queries it cannot
+    answer confidently are embedded with one encode() call and searched with
+    one index.search(), then fused.
+    """
+    ranked = {}
+    lexical_hits = {}
+    needs_dense = []
+    if bm25 is not None:
+        with tracer.span("rag.lexical", queries=len(keys)):
+            lexical_hits = {k: bm25.search(k, top_k * CANDIDATE_FACTOR) for k in keys}
+
+    for k in keys:
+        if bm25 is not None:
+            if mode == "lexical" or lexical_is_confident(lexical_hits[k], top_k):
+                ranked[k] = [cid for cid, _ in lexical_hits[k][:top_k]]
+                retrieval_stats["lexical_only"] += 1
+                continue
+        needs_dense.append(k)
+
+    if needs_dense:
+        depth = top_k if bm25 is None else top_k * CANDIDATE_FACTOR
+        vectors = embed_queries(needs_dense)
+        with tracer.span("rag.search", queries=len(needs_dense), depth=depth):
+            distances, indices = index.search(vectors, depth)
+
+        for k, row in zip(needs_dense, indices):
+            # FAISS pads with -1 when there are fewer than top_k chunks;
+            # other values are chunk ids (positions for pre-manifest indexes)
+            dense_ids = [int(i) for i in row if i != -1]
+            if bm25 is None:
+                ranked[k] = dense_ids[:top_k]
+                retrieval_stats["dense"] += 1
+            else:
+                ranked[k] = fuse_rankings(dense_ids, lexical_hits[k], top_k)
+                retrieval_stats["hybrid"] += 1
+
+    return ranked
+
+
+def shard_for(topic):
+    """The shard name a topic is searched in; None means the global index."""
+    if not TOPIC_SHARDS or not topic:
+        return None
+    topic = SHARD_ALIASES.get(topic, topic)
+    return topic if topic in registry.get("rag_shards") else None
+
+
+def retrieve_context_batch(queries, top_k=3, mode=None, topics=None):
+    """
+    Retrieves top_k chunks for many queries, in query order. topics (one per
+    query, e.g. the parser's detected topic) restricts each query to that
+    topic's shard; topics without a shard (general_math) search globally.
+    """
+    mode = mode or RETRIEVAL_MODE
+    keys = [normalize_query(q) for q in queries]
+    shards = [shard_for(t) for t in (topics or [None] * len(queries))]
+    results = [result_cache.get((k, top_k, mode, s)) for k, s in zip(keys, shards)]
+    missing = list(dict.fromkeys((k, s) for k, s, r in zip(keys, shards, results) if r is None))
+
+    if missing:
+        index, chunks = registry.get("rag_index")
+        bm25 = registry.get("bm25") if mode != "dense" else None
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+        fresh = {}
+        for shard in dict.fromkeys(s for _, s in missing):
+            if shard is None:
+                shard_index, shard_bm25 = index, bm25
+            else:
+                shard_index, shard_bm25 = registry.get("rag_shards")[shard]
+                shard_bm25 = shard_bm25 if mode != "dense" else None
 
-index = faiss.read_index(os.path.join(INDEX_PATH, "math.index"))
+            group = [k for k, s in missing if s == shard]
+            for k, ids in rank_queries(group, shard_index, shard_bm25, top_k, mode).items():
+                fresh[(k, shard)] = [chunks[cid] for cid in ids]
+                result_cache.put((k, top_k, mode, shard), fresh[(k, shard)])
 
-with open(os.path.join(INDEX_PATH, "chunks.pkl"), "rb") as f:
-    chunks = pickle.load(f)
+        results = [r if r is not None else fresh[(k, s)] for k, s, r in zip(keys, shards, results)]
 
+    return [list(r) for r in results]
 
-def retrieve_context(query, top_k=3):
-    query_embedding = model.encode([query])
-    distances, indices = index.search(query_embedding, top_k)
 
-    return [chunks[i] for i in indices[0]]
+def retrieve_context(query, top_k=3, mode=None, topic=None):
+    return retrieve_context_batch([query], top_k, mode, [topic])[0]
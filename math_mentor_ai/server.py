@@ -0,0 +1,498 @@
+"""
+Headless HTTP service: the agent pipeline behind a small asyncio HTTP/1.1
+server (standard library only), so the tutor can sit behind any frontend
+and be scaled separately from the Streamlit UI.
+
+    python server.py --port 8000
+    curl -X POST localhost:8000/solve/text -d '{"text": "solve 2x + 3 = 7"}'
+    curl -X POST localhost:8000/solve/image --data-binary @page.jpg
+    curl -X POST "localhost:8000/solve/audio?format=mp3" --data-binary @question.mp3
+    curl localhost:8000/health
+
+Each heavy stage (OCR, ASR, embedding, SymPy) has its own bounded executor
+and a bounded wait queue. When a required stage is full the request is
+refused at once with 503 and Retry-After instead of queueing without bound;
+when the optional retrieval stage is full the problem is solved without
+related concepts ("skipped_stages": ["retrieve"]), and likewise for the
+memory lookup. SymPy work, parsing included, runs in the deadline-bounded
+worker processes, as in the app and batch mode.
+Measure throughput with python -m benchmarks.bench_service.
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import io
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from agents.parser_agent import parser_agent
+from agents.intent_router import intent_router
+from agents.explainer_agent import explainer_agent
+from agents.worker_pool import SympyWorkerPool, SOLVE_TIMEOUT
+from model_registry import registry
+from model_server import model_client
+from tracing import tracer
+
+# ---------------- LIMITS ----------------
+MAX_INFLIGHT = int(os.environ.get("SERVICE_MAX_INFLIGHT", "64"))        # requests being handled at once
+MAX_BODY_MB = float(os.environ.get("SERVICE_MAX_BODY_MB", "25"))
+READ_TIMEOUT = 30.0     # seconds to receive a request once the connection is idle
+MAX_HEADERS = 100       # header lines per request
+RETRY_AFTER = 1         # seconds, sent with every 503
+
+# Stage -> (worker threads, requests allowed to wait for one). SymPy's
+# workers are the processes of the worker pool.
+STAGE_LIMITS = {
+    "ocr": (int(os.environ.get("SERVICE_OCR_WORKERS", "1")), int(os.environ.get("SERVICE_OCR_QUEUE", "8"))),
+    "asr": (int(os.environ.get("SERVICE_ASR_WORKERS", "1")), int(os.environ.get("SERVICE_ASR_QUEUE", "4"))),
+    "embedding": (int(os.environ.get("SERVICE_EMBED_WORKERS", "2")), int(os.environ.get("SERVICE_EMBED_QUEUE", "32"))),
+    "memory": (int(os.environ.get("SERVICE_MEMORY_WORKERS", "2")), int(os.environ.get("SERVICE_MEMORY_QUEUE", "32"))),
+    "sympy": (None, int(os.environ.get("SERVICE_SYMPY_QUEUE", "32"))),
+}
+
+AUDIO_TYPES = {"audio/mpeg": ".mp3", "audio/mp3": ".mp3", "audio/wav": ".wav", "audio/x-wav": ".wav",
+               "audio/ogg": ".ogg", "audio/mp4": ".m4a", "audio/x-m4a": ".m4a", "audio/aac": ".aac"}
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class Overloaded(Exception):
+    def __init__(self, stage):
+        super().__init__(f"The {stage} stage is at capacity. Please retry shortly.")
+        self.stage = stage
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Stage:
+    """
+    One pipeline stage with its own executor. At most `workers` calls run at
+    once and at most `queue` more wait for a slot; further calls are refused
+    with Overloaded straight away (load shedding). A request that needs the
+    stage several times takes a reservation() once, so it is only ever
+    refused before its first call.
+    """
+
+    def __init__(self, name, workers, queue):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix=f"stage-{name}")
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = 0                  # running + waiting
+        self.counts = Counter()
+
+    def full(self):
+        return self.pending >= self.workers + self.queue
+
+    def admit(self):
+        if self.full():
+            self.counts["shed"] += 1
+            raise Overloaded(self.name)
+
+    @contextlib.contextmanager
+    def reservation(self):
+        """Admits a request once and counts it as pending until it leaves the block."""
+        self.admit()
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn, *args, reserved=False, **kwargs):
+        """Runs fn on the executor. reserved: the caller holds a reservation(), so this is never shed."""
+        if not reserved:
+            self.admit()
+            self.pending += 1
+        try:
+            async with self.slots:
+                # Copy the context so tracing spans nest under the request's
+                call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+                return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        finally:
+            if not reserved:
+                self.pending -= 1
+            self.counts["completed"] += 1
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue,
+            "pending": self.pending,
+            "completed": self.counts["completed"],
+            "shed": self.counts["shed"],
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SolveService:
+    """The agents behind per-stage limits; each solve_* returns a run_pipeline-shaped dict."""
+
+    def __init__(self, workers=None, timeout=SOLVE_TIMEOUT, use_rag=True, use_memory=True):
+        self.pool = SympyWorkerPool(size=workers, timeout=timeout)
+        self.stages = {}
+        for name, (threads, queue) in STAGE_LIMITS.items():
+            self.stages[name] = Stage(name, threads or self.pool.size, queue)
+
+        self.use_rag = use_rag and registry.is_enabled("rag")
+        self.use_memory = use_memory
+        self.retrieve = self.find_similar = None
+        if self.use_rag:
+            from rag.retriever import retrieve_context
+            self.retrieve = retrieve_context
+        if self.use_memory:
+            from agents.memory_agent import memory_manager
+            self.find_similar = memory_manager.find_similar
+
+        self.inflight = 0
+        self.counts = Counter()
+
+    async def timed(self, timings, stage, awaitable):
+        t0 = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = round((time.perf_counter() - t0) * 1000, 3)
+
+    async def solve_text(self, text, timings=None):
+        timings = {} if timings is None else timings
+        sympy_stage = self.stages["sympy"]
+        result = {
+            "problem_text": None,
+            "topic": None,
+            "intent": None,
+            "solution": None,
+            "steps": [],
+            "verified": False,
+            "verification_reason": None,
+            "explanation": None,
+            "retrieved_chunks": [],
+            "memory_match": None,
+            "error": None,
+            "skipped_stages": [],
+            "timings": timings
+        }
+
+        # Shed before parsing: a request the solver cannot take should cost nothing.
+        # The reservation covers solve and verify, so a solved problem is never refused its check.
+        with sympy_stage.reservation():
+            await self.solve_reserved(text, result, timings)
+        return result
+
+    def optional(self, timings, stage, call):
+        """Starts an optional stage alongside the solve; see collect()."""
+        task = asyncio.create_task(self.timed(timings, stage, call))
+        # Mark its outcome as seen even when the request fails first
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return task
+
+    async def collect(self, task, stage, result):
+        """The optional stage's result, or None when it was shed (listed in skipped_stages)."""
+        try:
+            return await task
+        except Overloaded:
+            result["skipped_stages"].append(stage)
+            return None
+
+    async def solve_reserved(self, text, result, timings):
+        sympy_stage = self.stages["sympy"]
+
+        # Regex only (see agents.parser_agent); SymPy parses the text in the worker, under the deadline
+        with tracer.span("parser"):
+            t0 = time.perf_counter()
+            parsed_output = parser_agent(text)
+            timings["parser"] = round((time.perf_counter() - t0) * 1000, 3)
+        result["problem_text"] = parsed_output["problem_text"]
+        result["topic"] = parsed_output["topic"]
+        if parsed_output["needs_clarification"]:
+            result["error"] = parsed_output["clarification_question"]
+            return
+
+        intent = intent_router(parsed_output)
+        result["intent"] = intent
+        problem = parsed_output["problem_text"]
+
+        # Retrieval and the memory lookup run alongside the solve; both are
+        # optional, so a full stage only drops them from the answer
+        rag_task = memory_task = None
+        if self.retrieve is not None and intent != "chitchat":
+            rag_task = self.optional(timings, "retrieve", self.stages["embedding"].run(
+                tracer.traced("retrieve")(self.retrieve), problem, topic=parsed_output["topic"]
+            ))
+        if self.find_similar is not None and intent == "solve_math":
+            memory_task = self.optional(timings, "memory", self.stages["memory"].run(
+                tracer.traced("memory")(self.find_similar), problem
+            ))
+
+        try:
+            if intent == "solve_math":
+                solver_output = await self.timed(timings, "solver", sympy_stage.run(
+                    tracer.traced("solver")(self.pool.run), "solve", problem, [], reserved=True
+                ))
+                result["solution"] = solver_output["solution"]
+                result["steps"] = solver_output["steps"]
+
+                if solver_output["error"]:
+                    result["error"] = solver_output["error"]
+                else:
+                    verifier_output = await self.timed(timings, "verifier", sympy_stage.run(
+                        tracer.traced("verifier")(self.pool.run), "verify",
+                        problem, solver_output["solution"], solver_output["values"], solver_output["target"],
+                        reserved=True
+                    ))
+                    result["verified"] = verifier_output["verified"]
+                    result["verification_reason"] = verifier_output["reason"]
+                    result["explanation"] = explainer_agent(
+                        problem, solver_output["steps"], solver_output["solution"]
+                    )
+
+            elif intent == "chitchat":
+                result["error"] = "Input ambiguous or off-topic."
+
+            if memory_task is not None:
+                similar_entry = await self.collect(memory_task, "memory", result)
+                if similar_entry:
+                    result["memory_match"] = similar_entry.get("problem_text")
+
+            if rag_task is not None:
+                try:
+                    result["retrieved_chunks"] = await self.collect(rag_task, "retrieve", result) or []
+                except Exception as e:
+                    result["error"] = result["error"] or f"RAG Retrieval failed: {e}"
+        finally:
+            for task in (rag_task, memory_task):
+                if task is not None:
+                    task.cancel()
+
+    async def solve_image(self, data):
+        from multimodal.image_ocr import extract_text_from_image
+
+        timings = {}
+        extracted = await self.timed(timings, "ocr", self.stages["ocr"].run(
+            tracer.traced("ocr")(extract_text_from_image), io.BytesIO(data)
+        ))
+        return await self.solve_extracted(extracted, timings)
+
+    async def solve_audio(self, data, suffix):
+        from multimodal.audio_asr import transcribe_audio
+
+        upload = io.BytesIO(data)
+        upload.name = "upload" + suffix    # tells the decoder the container format
+        timings = {}
+        extracted = await self.timed(timings, "asr", self.stages["asr"].run(
+            tracer.traced("asr")(transcribe_audio), upload
+        ))
+        return await self.solve_extracted(extracted, timings)
+
+    async def solve_extracted(self, extracted, timings):
+        if not extracted["text"]:
+            return {"input": extracted, "error": "No text could be extracted.", "timings": timings}
+        result = await self.solve_text(extracted["text"], timings)
+        # Same threshold the app uses to ask for human review
+        return dict({"input": extracted, "needs_review": extracted["confidence"] < 0.6}, **result)
+
+    # ---------------- HTTP ----------------
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        routes = {
+            "/health": ("GET", self.health),
+            "/solve/text": ("POST", self.post_text),
+            "/solve/image": ("POST", self.post_image),
+            "/solve/audio": ("POST", self.post_audio),
+        }
+        if url.path not in routes:
+            raise HTTPError(404, f"No route for {url.path}")
+        allowed, handler = routes[url.path]
+        if method != allowed:
+            raise HTTPError(405, f"Use {allowed} for {url.path}")
+        return await handler(parse_qs(url.query), headers, body)
+
+    async def health(self, query, headers, body):
+        return {
+            "status": "ok",
+            "inflight": self.inflight,
+            "max_inflight": MAX_INFLIGHT,
+            "requests": dict(self.counts),
+            "stages": {name: stage.stats() for name, stage in self.stages.items()},
+            "models": registry.status(),
+        }
+
+    async def post_text(self, query, headers, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Body must be JSON: {\"text\": \"...\"}")
+        text = payload.get("text") or payload.get("problem") if isinstance(payload, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "Missing \"text\"")
+        return await self.solve_text(text)
+
+    async def post_image(self, query, headers, body):
+        if not body:
+            raise HTTPError(400, "Send the image bytes as the request body")
+        return await self.solve_image(body)
+
+    async def post_audio(self, query, headers, body):
+        if not body:
+            raise HTTPError(400, "Send the audio bytes as the request body")
+        suffix = "." + query["format"][0].lstrip(".") if "format" in query else \
+            AUDIO_TYPES.get(headers.get("content-type", "").split(";")[0].strip(), ".wav")
+        return await self.solve_audio(body, suffix)
+
+    async def respond(self, method, target, headers, body):
+        """(status, payload, extra headers) for one request, never raising."""
+        if self.inflight >= MAX_INFLIGHT:
+            self.counts["shed"] += 1
+            return 503, {"error": "Server busy. Please retry shortly."}, {"Retry-After": str(RETRY_AFTER)}
+
+        self.inflight += 1
+        try:
+            with tracer.span("http", method=method, target=target):
+                payload = await self.dispatch(method, target, headers, body)
+            self.counts["ok"] += 1
+            return 200, payload, {}
+        except Overloaded as e:
+            self.counts["shed"] += 1
+            return 503, {"error": str(e), "stage": e.stage}, {"Retry-After": str(RETRY_AFTER)}
+        except HTTPError as e:
+            self.counts["rejected"] += 1
+            return e.status, {"error": str(e)}, {}
+        except Exception as e:
+            self.counts["failed"] += 1
+            return 500, {"error": f"{type(e).__name__}: {e}"}, {}
+        finally:
+            self.inflight -= 1
+
+    async def handle_connection(self, reader, writer):
+        """HTTP/1.1 with keep-alive: requests on one connection are answered in order."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    write_response(writer, e.status, {"error": str(e)}, {}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                status, payload, extra = await self.respond(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, payload, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def shutdown(self):
+        for stage in self.stages.values():
+            stage.shutdown()
+        self.pool.shutdown()
+
+
+async def read_line(reader):
+    try:
+        return await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+    except (ValueError, asyncio.LimitOverrunError):
+        # Longer than the stream's line limit (64 KiB)
+        raise HTTPError(431, "Request line or header too long")
+
+
+async def read_request(reader):
+    """(method, target, headers, body) or None once the client closes the connection."""
+    line = await read_line(reader)
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HTTPError(431, f"More than {MAX_HEADERS} header lines")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", ""):
+        raise HTTPError(411, "Chunked bodies are not supported; send Content-Length")
+    length = headers.get("content-length") or "0"
+    if not (length.isascii() and length.isdigit()):    # also refuses negative lengths
+        raise HTTPError(400, "Invalid Content-Length")
+    length = int(length)
+    if length > MAX_BODY_MB * 1024 * 1024:
+        raise HTTPError(413, f"Body larger than {MAX_BODY_MB:g} MB")
+    body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+    return method.upper(), target, headers, body
+
+
+def write_response(writer, status, payload, extra_headers, keep_alive):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **extra_headers
+    }
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+
+async def serve(host, port, service, warm_up=True):
+    if warm_up:
+        # WARM_UP_MODALITIES load in the background; early requests wait on the registry lock.
+        # Those a running model server answers for are not loaded here.
+        model_client.available()
+        registry.warm_up()
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=MAX_INFLIGHT * 2)
+    print(f"✅ Serving on http://{host}:{port} ({service.pool.size} SymPy workers)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP solve service for the agent pipeline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="SymPy worker processes (default: CPUs - 1)")
+    parser.add_argument("--timeout", type=float, default=SOLVE_TIMEOUT, help="Per-problem solver/verifier budget in seconds")
+    parser.add_argument("--no-rag", action="store_true", help="Do not retrieve related concepts")
+    parser.add_argument("--no-memory", action="store_true", help="Do not look up similar problems in memory")
+    parser.add_argument("--no-warm-up", action="store_true", help="Load models on first use instead of at startup")
+    args = parser.parse_args()
+
+    service = SolveService(workers=args.workers, timeout=args.timeout,
+                           use_rag=not args.no_rag, use_memory=not args.no_memory)
+    try:
+        asyncio.run(serve(args.host, args.port, service, warm_up=not args.no_warm_up))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+# Finished traces are appended here as OTLP/JSON, one request per line (empty disables)
+TRACE_FILE = os.environ.get("TRACE_FILE", "data/traces.jsonl")
+TRACE_FILE_MB = float(os.environ.get("TRACE_FILE_MB", "16"))   # rotated to <file>.1 past this size
+SERVICE_NAME = "math_mentor_ai"
+
+# OTLP enums
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation. Spans of a request share a trace id and a list of finished spans."""
+
+    def __init__(self, name, trace_id, parent_id, finished, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.finished = finished          # shared by every span of the trace
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_otlp(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": otlp_value(v)} for k, v in self.attributes.items() if v is not None],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+
+
+class Tracer:
+    """
+    Minimal tracer producing OpenTelemetry-compatible spans without the SDK.
+    The current span lives in a context variable, so nested spans become
+    children. When a root span ends, the whole trace is appended to
+    TRACE_FILE in the OTLP/JSON layout the OpenTelemetry Collector's file
+    exporter uses. Spans created in a solver worker process are collected
+    there and attached to the caller's trace (see remote / attach).
+    """
+
+    def __init__(self, path=TRACE_FILE, max_bytes=int(TRACE_FILE_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def start(self, name, new_trace=False, **attributes):
+        """Starts a span as a child of the current one (or a new trace) and makes it current."""
+        parent = None if new_trace else _current_span.get()
+        if parent is None:
+            span = Span(name, secrets.token_hex(16), None, [], attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, parent.finished, attributes)
+        span.token = _current_span.set(span)
+        return span
+
+    def end(self, span, error=None, export=True):
+        """Finishes a span; a root span exports its trace unless export is False."""
+        span.end_ns = time.time_ns()
+        span.error = error
+        span.finished.append(span.to_otlp())
+        try:
+            _current_span.reset(span.token)
+        except ValueError:
+            # Ended in another context (e.g. a Streamlit rerun); just detach it
+            _current_span.set(None)
+        if span.parent_id is None and export:
+            self.export(span.finished)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end(span, error=f"{type(e).__name__}: {e}")
+            raise
+        self.end(span)
+
+    def traced(self, name):
+        """Decorator form of span()."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    # ---- crossing process boundaries ----
+    def current_context(self):
+        """(trace id, span id) of the current span, to hand to a worker process; None outside a trace."""
+        span = _current_span.get()
+        return (span.trace_id, span.span_id) if span else None
+
+    @contextmanager
+    def remote(self, context):
+        """
+        Runs under a parent span from another process. Spans created inside
+        are collected into the yielded list instead of being exported.
+        """
+        finished = []
+        if context is None:
+            yield finished
+            return
+        parent = Span("remote", context[0], None, finished, {})
+        parent.span_id = context[1]
+        token = _current_span.set(parent)
+        try:
+            yield finished
+        finally:
+            _current_span.reset(token)
+
+    def attach(self, spans):
+        """Adds spans finished in another process to the current trace."""
+        current = _current_span.get()
+        if current is not None and spans:
+            current.finished.extend(spans)
+
+    # ---- export ----
+    def export(self, spans):
+        if not self.path:
+            return
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": otlp_value(SERVICE_NAME)}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}]
+            }]
+        }
+        line = json.dumps(record) + "\n"
+        try:
+            with self.lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError:
+            pass  # tracing must never break a request
+
+
+def waterfall(spans):
+    """
+    Rows for a timing waterfall, in start order with children under their
+    parent: {"name", "depth", "start_ms", "end_ms", "duration_ms", "error"},
+    times relative to the earliest span.
+    """
+    if not spans:
+        return []
+
+    children = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        parent = s["parentSpanId"] if s["parentSpanId"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    origin = min(int(s["startTimeUnixNano"]) for s in spans)
+    rows = []
+
+    def visit(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda s: int(s["startTimeUnixNano"])):
+            start = (int(s["startTimeUnixNano"]) - origin) / 1e6
+            end = (int(s["endTimeUnixNano"]) - origin) / 1e6
+            rows.append({
+                "name": s["name"],
+                "depth": depth,
+                "start_ms": round(start, 2),
+                "end_ms": round(end, 2),
+                "duration_ms": round(end - start, 2),
+                "error": s["status"].get("message")
+            })
+            visit(s["spanId"], depth + 1)
+
+    visit(None, 0)
+    return rows
+
+
+# Singleton instance
+tracer = Tracer()